@@ -0,0 +1,231 @@
+"""Prebuilt assets. The 'build' command writes minified, content-hashed
+and precompressed (gzip/brotli) copies of the bundles and the static
+files (including the stylesheets) so that the server can send them
+straight from disk instead of building and compressing them on every
+request."""
+
+import json
+import mimetypes
+import os
+import threading
+
+from core.compression import CompressedContent
+from core.config import Config
+from core.files import BUNDLER
+from core.page import Page
+from optionals import jsmin, CSSMinifier
+
+
+__all__ = ["ASSETS"]
+
+
+class Assets:
+  """Builds the assets and finds them again when serving them."""
+
+  BUILD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build")
+  MANIFEST_FILENAME = "manifest.json"
+
+  # Third-party files are shipped minified already (we leave them, and
+  # their license headers, as they are).
+  VENDOR_DIRS = ("chartjs",)
+
+  # File extensions for each Content-Encoding variant.
+  ENCODING_EXTENSIONS = {
+    "br": ".br",
+    "gzip": ".gz",
+  }
+
+  def __init__(self, build_dir: str = None):
+    self.build_dir = build_dir or self.BUILD_DIR
+    self._lock = threading.Lock()
+    self._manifest = None
+    self._manifest_mtime = None
+
+  #
+  # Serving
+  #
+  def find(self, name: str) -> dict | None:
+    """Returns the manifest entry of the built asset for this name (eg.
+    'static/informer.js'), as long as it is still up to date with its
+    sources and the config. Returns None otherwise."""
+
+    entry = self._get_manifest().get(name)
+    if entry is None:
+      return None
+
+    config_hash = entry.get("config")
+    if config_hash is not None:
+      try:
+        if Config().get_snapshot().hash != config_hash:
+          return None
+      except Exception:
+        return None
+
+    for path, mtime in entry["sources"].items():
+      try:
+        if os.stat(path).st_mtime_ns != mtime:
+          return None
+      except OSError:
+        return None
+
+    return entry
+
+  def get_variant(self, entry: dict, accepted: list[str]) -> tuple[str | None, str]:
+    """Returns the (encoding, path) of the file to send given the
+    encodings the client accepts. The encoding is None for the plain
+    file."""
+
+    for encoding in entry["encodings"]:
+      if encoding in accepted:
+        return encoding, os.path.join(self.build_dir, entry["file"] + self.ENCODING_EXTENSIONS[encoding])
+    return None, os.path.join(self.build_dir, entry["file"])
+
+  def _get_manifest(self) -> dict:
+    """Returns the manifest, loading it again if it changed on disk."""
+
+    path = os.path.join(self.build_dir, self.MANIFEST_FILENAME)
+    try:
+      mtime = os.stat(path).st_mtime_ns
+    except OSError:
+      return {}
+
+    if mtime != self._manifest_mtime:
+      with self._lock:
+        try:
+          with open(path) as fp:
+            self._manifest = json.load(fp)
+          self._manifest_mtime = mtime
+        except Exception as e:
+          print(f"Unable to load the assets manifest: {str(e)}")
+          return {}
+
+    return self._manifest
+
+  #
+  # Building
+  #
+  def build(self, version: str) -> int:
+    """Build all the assets and return the number of files built."""
+
+    os.makedirs(self.build_dir, exist_ok=True)
+    snapshot = Config().get_snapshot()
+    manifest = {}
+
+    # Bundles: the main ones and the ones for each page.
+    bundles = {
+      (("informer",), "informercss"),
+      (("informer",), "informerjs"),
+      (("theme",), "themecss"),
+    }
+
+    theme = Config().theme
+    pages = snapshot.data.get("pages")
+    for page_config in pages if isinstance(pages, list) else []:
+      if not isinstance(page_config, dict):
+        continue
+      page = Page(snapshot.data, page_config, theme, version)
+      bundles.add((tuple(sorted(page.style_files)), "css"))
+      bundles.add((tuple(sorted(page.script_files)), "js"))
+
+    for bundle_files, bundle_type in sorted(bundles):
+      if not bundle_files:
+        continue
+      bundle_files = list(bundle_files)
+      name = BUNDLER.get_bundle_name(bundle_files, bundle_type)
+      content = BUNDLER.get_bundle(bundle_files, bundle_type)
+      config_hash = snapshot.hash if bundle_type in BUNDLER.TEMPLATE_BUNDLE_TYPES else None
+      sources = [ BUNDLER.get_source_path(filename, bundle_type) for filename in bundle_files ]
+      manifest[name] = self._write(f"bundles/{name}", content, sources, config_hash)
+
+    # Static files
+    for dirpath, _, filenames in os.walk("./static"):
+      for filename in sorted(filenames):
+        path = os.path.join(dirpath, filename)
+        name = os.path.relpath(path, ".")
+        with open(path, "rb") as fp:
+          data = fp.read()
+
+        is_vendor = any(part in self.VENDOR_DIRS for part in name.split(os.sep))
+        if not is_vendor:
+          data = self._minify(data, filename)
+
+        content = CompressedContent(data, self._get_mimetype(filename))
+        manifest[name] = self._write(name, content, [path], None)
+
+    # Write the manifest last (atomically) and clean up the files from
+    # any previous builds.
+    manifest_path = os.path.join(self.build_dir, self.MANIFEST_FILENAME)
+    with open(f"{manifest_path}.tmp", "w") as fp:
+      json.dump(manifest, fp, indent=2, sort_keys=True)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    self._remove_stale_files(manifest)
+    return len(manifest)
+
+  def _write(self, name: str, content: CompressedContent, sources: list[str], config_hash: str | None) -> dict:
+    """Writes the content (and its compressed variants) to the build
+    directory, using a content-hashed filename. Returns the manifest
+    entry."""
+
+    stem, ext = os.path.splitext(name)
+    filename = f"{stem}.{content.etag}{ext}"
+    path = os.path.join(self.build_dir, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    files = [ (path, content.content) ]
+    for encoding, compressed in content.variants.items():
+      files.append((path + self.ENCODING_EXTENSIONS[encoding], compressed))
+
+    for file_path, data in files:
+      with open(file_path, "wb") as fp:
+        fp.write(data)
+
+    print(f"  - {name} -> {filename} ({', '.join(['identity', *content.variants])})")
+
+    return {
+      "file": filename,
+      "hash": content.etag,
+      "mimetype": content.mimetype,
+      "encodings": list(content.variants),
+      "sources": { source: os.stat(source).st_mtime_ns for source in sources },
+      "config": config_hash,
+    }
+
+  def _remove_stale_files(self, manifest: dict) -> None:
+    """Removes the files in the build directory that are not part of the
+    manifest."""
+
+    keep = { self.MANIFEST_FILENAME }
+    for entry in manifest.values():
+      keep.add(entry["file"])
+      for encoding in entry["encodings"]:
+        keep.add(entry["file"] + self.ENCODING_EXTENSIONS[encoding])
+
+    for dirpath, _, filenames in os.walk(self.build_dir):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        if os.path.relpath(path, self.build_dir) not in keep:
+          os.unlink(path)
+
+  def _minify(self, data: bytes, filename: str) -> bytes:
+    """Minify JS and CSS files, leave anything else as is."""
+
+    if filename.endswith(".js"):
+      return jsmin(data.decode()).strip().encode()
+    if filename.endswith(".css"):
+      try:
+        return CSSMinifier(data.decode())().strip().encode()
+      except Exception as e:
+        print(f"Could not minify the CSS: {str(e)}")
+    return data
+
+  def _get_mimetype(self, filename: str) -> str:
+    """Returns the mimetype for this filename."""
+    mimetype, _ = mimetypes.guess_type(filename)
+    return mimetype or "application/octet-stream"
+
+
+#
+# Create the Assets
+#
+ASSETS = Assets()
@@ -4,6 +4,7 @@ import os
 import pendulum
 import re
 import requests_cache
+import time
 
 
 from platformdirs import user_cache_dir
@@ -77,7 +78,7 @@ class Cache:
                                              expire_after=duration)
       self._request_sessions[cache_file] = session
 
-      now = pendulum.now().int_timestamp
+      now = int(time.time())
       if self._last_clean is not None and now - self._last_clean > 10 * 60:
         # Let's delete expired caches.
         session.cache.delete(expired=True)
@@ -94,6 +95,11 @@ class Cache:
 
     files = []
     for filename in filenames:
+      # Only the requests caches (other things, such as the compiled
+      # templates, may be stored here as well).
+      if not filename.startswith("requests-") or not filename.endswith(".sqlite"):
+        continue
+
       path = os.path.join(f"{self.FULL_CACHE_DIR}", filename)
       toolname, wt, duration = filename.replace(".sqlite", "").split("-")
 
@@ -238,14 +244,18 @@ class Cache:
     valid = set()
     to_remove = set()
 
-    for cfg in widgets:
+    for found in widgets:
+      widget = found.widget
+      if widget is None:
+        continue
+
       # Attempt to find all possible "durations" for this widget
-      cache_duration = cfg.get("cache")
+      cache_duration = found.config.get("cache")
       if cache_duration is None:
-        cache_duration = cfg['_widget'].params["cache"]
+        cache_duration = widget.params["cache"]
 
       if cache_duration is None:
-        timeout = cfg['_widget'].REQUESTS_SESSION_CACHE_TIMEOUT
+        timeout = widget.REQUESTS_SESSION_CACHE_TIMEOUT
         if isinstance(timeout, int):
           cache_duration = f"{timeout}s"
 
@@ -255,7 +265,7 @@ class Cache:
         continue
 
       durations = { duration }
-      alternate_durations = cfg["_widget"].ALTERNATE_CACHE_DURATIONS
+      alternate_durations = widget.ALTERNATE_CACHE_DURATIONS
       if isinstance(alternate_durations, str):
         alternate_durations = [alternate_durations]
       if isinstance(alternate_durations, list):
@@ -268,7 +278,7 @@ class Cache:
       # Keep track of all valid selections (meaning that these are
       # possible caches based on the widgets in the config file.
       for duration in durations:
-        key = f"{cfg['_widget'].cache_widget_type}-{self._human_readable_duration(duration)}"
+        key = f"{widget.cache_widget_type}-{self._human_readable_duration(duration)}"
         valid.add(key)
 
     # Compare to the cache files on disk. If they are not valid, flag
@@ -320,7 +330,7 @@ class Cache:
     n, unit = mo.groups()
     n = int(n)
 
-    expires_ts = pendulum.now().int_timestamp
+    expires_ts = int(time.time())
 
     seconds = 0
 
@@ -351,7 +361,7 @@ class Cache:
 
     expires_ts = self.duration_to_ts(duration_code)
 
-    now = pendulum.now().int_timestamp
+    now = int(time.time())
     if now >= expires_ts:
       # Already expired, don't bother!
       return False
@@ -369,7 +379,7 @@ class Cache:
     the data is not in cache or if it is expired. This method will also
     remove the expired cache entry if it is found."""
 
-    now = pendulum.now().int_timestamp
+    now = int(time.time())
 
     widget_cache = self._cache.get(widget_type)
     if not isinstance(widget_cache, dict):
@@ -394,7 +404,7 @@ class Cache:
     """Run through all the data and expire the caches that are
     expired."""
 
-    now = pendulum.now().int_timestamp
+    now = int(time.time())
     to_delete = set()
 
     for widget_type, widget_cache in self._cache.items():
@@ -0,0 +1,82 @@
+"""Request coalescing. Some APIs (eg. Open-Meteo) answer for several
+items (eg. locations) in one request: the fetches that arrive within a
+short window, with the same group key (eg. the same request parameters),
+are then made as one batch instead of one request each."""
+
+import threading
+import time
+
+
+__all__ = ["Coalescer"]
+
+
+class Batch:
+  """The items collected for one batch call, and its results."""
+
+  def __init__(self) -> None:
+    self.items = []
+    self.results = None
+    self.done = threading.Event()
+
+
+class Coalescer:
+  """Collects the items submitted (from any thread) within 'window'
+  seconds, per group key, and makes a single batch call for them. The
+  first thread to submit an item to a group waits for the window then
+  makes the call, the others wait for its results."""
+
+  def __init__(self, window: float = 0.05, max_items: int | None = None) -> None:
+    self.window = window
+    self.max_items = max_items
+    self._lock = threading.Lock()
+    self._pending = {}
+    self._stats = { "items": 0, "batches": 0 }
+
+  @property
+  def stats(self) -> dict:
+    """Returns the number of items submitted and of batch calls made."""
+    with self._lock:
+      return dict(self._stats)
+
+  def submit(self, group: str, item: any, batch_func: callable) -> any:
+    """Returns the result for this item: batch_func(items) is called
+    once for all the items submitted to this group within the window and
+    returns their results (a list, in the same order). An exception
+    raised by batch_func is raised for all the items, an exception in
+    the results only for its item."""
+
+    with self._lock:
+      self._stats["items"] += 1
+      batch = self._pending.get(group)
+      is_leader = batch is None
+      if is_leader:
+        batch = self._pending[group] = Batch()
+        self._stats["batches"] += 1
+
+      index = len(batch.items)
+      batch.items.append(item)
+      if self.max_items is not None and len(batch.items) >= self.max_items:
+        # Full: the next items start another batch.
+        self._pending.pop(group, None)
+
+    if is_leader:
+      time.sleep(self.window)
+      with self._lock:
+        if self._pending.get(group) is batch:
+          del self._pending[group]
+
+      try:
+        batch.results = batch_func(list(batch.items))
+        if len(batch.results) != len(batch.items):
+          raise RuntimeError(f"Got {len(batch.results)} results for {len(batch.items)} items.")
+      except Exception as e:
+        batch.results = [ e ] * len(batch.items)
+      finally:
+        batch.done.set()
+    else:
+      batch.done.wait()
+
+    result = batch.results[index]
+    if isinstance(result, Exception):
+      raise result
+    return result
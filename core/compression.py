@@ -0,0 +1,61 @@
+"""Precompressed content. The content is compressed once (gzip and, if
+available, brotli) so that it can be served many times at no cost."""
+
+import gzip
+import hashlib
+
+from optionals import brotli
+
+
+__all__ = ["CompressedContent"]
+
+
+class CompressedContent:
+  """Holds some content along with its strong ETag and precompressed
+  variants (by Content-Encoding)."""
+
+  # Don't bother compressing anything smaller than this (bytes).
+  MIN_SIZE = 500
+
+  def __init__(self, content: str | bytes, mimetype: str) -> None:
+    if isinstance(content, str):
+      content = content.encode()
+
+    self.content = content
+    self.mimetype = mimetype
+
+    md5 = hashlib.md5(b"Informer")
+    md5.update(content)
+    self.etag = md5.hexdigest()
+
+    self.variants = {}
+    if len(content) >= self.MIN_SIZE:
+      if brotli is not None:
+        self._add_variant("br", brotli.compress(content))
+      self._add_variant("gzip", gzip.compress(content, compresslevel=9, mtime=0))
+
+  def _add_variant(self, encoding: str, compressed: bytes) -> None:
+    """Keep the compressed variant, unless it isn't any smaller."""
+    if len(compressed) < len(self.content):
+      self.variants[encoding] = compressed
+
+  def get_variant(self, accepted: list[str]) -> tuple[str | None, bytes]:
+    """Returns the (encoding, content) to send given the encodings the
+    client accepts, in order of our preference. The encoding is None if
+    the content is sent as-is."""
+
+    for encoding, compressed in self.variants.items():
+      if encoding in accepted:
+        return encoding, compressed
+    return None, self.content
+
+  def get_etag(self, encoding: str | None) -> str:
+    """Returns the ETag for the variant (each variant needs its own
+    strong ETag)."""
+    return f"{self.etag}-{encoding}" if encoding else self.etag
+
+  def matches(self, etags: list[str]) -> bool:
+    """Returns True if one of the supplied ETags (If-None-Match) refers
+    to this content, in any of its variants."""
+    valid = { self.get_etag(encoding) for encoding in (None, *self.variants) }
+    return any(etag in valid for etag in etags)
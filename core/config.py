@@ -1,12 +1,25 @@
 """Config Loader. Loads the config file and prepares the Themes (uses
 defaults that can get overwritten by config settings)."""
 
+import copy
+import hashlib
+import os
+import threading
 import yaml
 
+from core.serialization import dumps_bytes
 from templates.loader import get_hex_color, page_name
 
 
-__all__ = ["Config", "ConfigLoadException"]
+__all__ = [
+  "Config",
+  "ConfigLoadException",
+  "ConfigSnapshot",
+  "FrozenDict",
+  "FrozenList",
+  "freeze",
+  "get_config_hash",
+]
 
 
 #
@@ -17,6 +30,84 @@ class ConfigLoadException(Exception):
   pass
 
 
+#
+# Frozen Containers
+# The parsed config is shared by all requests (and threads), so it must
+# never be modified once loaded. These behave like the dict and list
+# they replace (isinstance checks, JSON, templates) but refuse changes.
+# Copying one returns a regular, mutable, dict or list.
+#
+class FrozenDict(dict):
+  """A dict that cannot be modified."""
+
+  def _readonly(self, *args, **kwargs):
+    raise TypeError("The config is read-only.")
+
+  __setitem__ = __delitem__ = __ior__ = _readonly
+  clear = pop = popitem = setdefault = update = _readonly
+
+  def __copy__(self) -> dict:
+    return dict(self)
+
+  def __deepcopy__(self, memo: dict) -> dict:
+    return { k: copy.deepcopy(v, memo) for k, v in self.items() }
+
+
+class FrozenList(list):
+  """A list that cannot be modified."""
+
+  def _readonly(self, *args, **kwargs):
+    raise TypeError("The config is read-only.")
+
+  __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+  append = clear = extend = insert = pop = remove = reverse = sort = _readonly
+
+  def __copy__(self) -> list:
+    return list(self)
+
+  def __deepcopy__(self, memo: dict) -> list:
+    return [ copy.deepcopy(v, memo) for v in self ]
+
+
+def freeze(value: any) -> any:
+  """Returns a frozen copy of the value (dicts and lists, recursively)."""
+
+  if isinstance(value, dict):
+    return FrozenDict({ k: freeze(v) for k, v in value.items() })
+  if isinstance(value, list):
+    return FrozenList([ freeze(v) for v in value ])
+  return value
+
+
+#
+# Utilities
+#
+def get_config_hash(config: dict) -> str:
+  """Returns the MD5 Hash for this config."""
+  md5 = hashlib.md5(b"InformerConfig")
+  md5.update(dumps_bytes(config, sort_keys=True))
+  return md5.hexdigest()
+
+
+#
+# Config Snapshot
+#
+class ConfigSnapshot:
+  """A parsed config file. A new snapshot gets created every time the
+  config file changes on disk and each one gets the next generation
+  number. Caches that depend on the config should be keyed off the
+  generation (in-process) or the hash (shared between processes).
+
+  The data is frozen (see FrozenDict, FrozenList) so that one snapshot
+  can safely be shared between requests and threads."""
+
+  def __init__(self, data: dict, generation: int, stat_key: tuple) -> None:
+    self.data = freeze(data)
+    self.generation = generation
+    self.stat_key = stat_key
+    self.hash = get_config_hash(self.data)
+
+
 #
 # Config
 #
@@ -24,6 +115,7 @@ class Config:
   """Singleton that holds is used to load the yaml configuration. It
   also defines the default theme information."""
   _instance = None
+  _lock = threading.Lock()
 
   def __new__(cls, *args, **kwargs):
     if cls._instance is None:
@@ -44,38 +136,73 @@ class Config:
     """Load the latest config from disk, or use the cache if we already
     have it and use_cache is True. Typically, we wouldn't want to load
     from cache, as we'd want to make sure we load all the latest updates
-    the user may have made."""
+    the user may have made (see snapshot: the file only gets parsed again
+    if it changed on disk)."""
+
+    return self.get_snapshot(use_cache=use_cache).data
 
-    if use_cache and hasattr(self, "_load_data"):
-      return self._load_data
+  def get_snapshot(self, use_cache: bool = False) -> ConfigSnapshot:
+    """Returns the snapshot of the current config. Unless use_cache is
+    True (and we already have a snapshot), we stat the config file and
+    only parse it again if it has changed since the last snapshot."""
+
+    snapshot = getattr(self, "_snapshot", None)
+    if use_cache and snapshot is not None:
+      return snapshot
 
-    # Parse the config
     try:
-      with open(self.config_path) as fp:
-        load_data = yaml.safe_load(fp.read())
-        load_data = self._sanitize(load_data)
-        setattr(self, "_load_data", load_data)
-        return load_data
+      stat = os.stat(self.config_path)
     except Exception as e:
       raise ConfigLoadException(f"Error parsing the config file: <pre>{str(e)}</pre>") from e
-    # return None
+
+    stat_key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if snapshot is not None and snapshot.stat_key == stat_key:
+      return snapshot
+
+    with self._lock:
+      # Another thread may have parsed it while we were waiting.
+      snapshot = getattr(self, "_snapshot", None)
+      if snapshot is not None and snapshot.stat_key == stat_key:
+        return snapshot
+
+      # Parse the config
+      try:
+        with open(self.config_path) as fp:
+          load_data = yaml.safe_load(fp.read())
+          load_data = self._sanitize(load_data)
+      except Exception as e:
+        raise ConfigLoadException(f"Error parsing the config file: <pre>{str(e)}</pre>") from e
+
+      generation = snapshot.generation + 1 if snapshot is not None else 1
+      snapshot = ConfigSnapshot(load_data, generation, stat_key)
+
+      # Swap in the new snapshot (a single assignment, readers either
+      # get the old or the new one).
+      self._snapshot = snapshot
+
+    return snapshot
+
+  @property
+  def generation(self) -> int:
+    """Returns the generation of the current config snapshot."""
+    return self.get_snapshot().generation
 
   def _sanitize(self, config: dict):
     """Ensures each page has a slug definition and that hidden pages
-    get removed. Modifies the config dictionary and returns it. This
-    modifies the dictionary itself and returns it."""
+    get removed. Returns a new config dictionary, the one supplied is
+    left untouched."""
 
-    pages = []
+    config = dict(config)
 
     if "pages" in config and isinstance(config["pages"], list):
+      pages = []
       for page in config["pages"]:
         if isinstance(page, dict):
           name = page.get("name")
           slug = page.get("slug")
 
           if name and not slug:
-            slug = page_name(name)
-            page["slug"] = slug
+            page = dict(page, slug=page_name(name))
 
           if not page.get("hide") is True:
             pages.append(page)
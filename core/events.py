@@ -0,0 +1,148 @@
+"""Server-Sent Events. Pages subscribe to the widgets they display and
+the server pushes the widget data to them when it changes, instead of
+every page polling every widget.
+
+The hub lives in each worker process: a worker refreshes the widgets
+its own subscribers display and pushes the data to them only. With
+several workers, a widget shown by pages connected to different
+workers is refreshed by each of them (the data cache and the rate
+limits, see core.ratelimit, are shared)."""
+
+import queue
+import threading
+import time
+
+from core.compression import CompressedContent
+from core.serialization import dumps
+
+
+__all__ = ["EVENTS", "Subscription"]
+
+
+class Subscription:
+  """A subscriber (one page, one connection) to the events of some
+  widgets. The events are waiting in its queue."""
+
+  # Don't let a client that stopped reading hold on to an unbounded
+  # amount of data: the oldest events are dropped.
+  MAX_QUEUED_EVENTS = 100
+
+  def __init__(self, widget_ids: set[str]) -> None:
+    self.widget_ids = widget_ids
+    self.queue = queue.Queue(maxsize=self.MAX_QUEUED_EVENTS)
+
+  def put(self, event: str) -> None:
+    """Queue an event (a JSON string) for this subscriber."""
+    while True:
+      try:
+        self.queue.put_nowait(event)
+        return
+      except queue.Full:
+        try:
+          self.queue.get_nowait()
+        except queue.Empty:
+          pass
+
+  def get(self, timeout: float) -> str | None:
+    """Returns the next event, or None if there was none for 'timeout'
+    seconds."""
+    try:
+      return self.queue.get(timeout=timeout)
+    except queue.Empty:
+      return None
+
+
+class EventHub:
+  """Keeps track of the subscriptions (of this worker) and publishes the
+  widget data to the subscribers. Data is only published when it
+  changed (ETag) since it was last published for that widget, so a
+  single fetch feeds every subscriber of the worker and unchanged data
+  is never sent."""
+
+  # Each subscriber holds a thread of the worker for as long as it is
+  # connected (see widget_events()): past this many, the subscriptions
+  # are refused and the pages poll instead, so that the other requests
+  # always have threads left (the Dockerfile runs 32 per worker).
+  MAX_SUBSCRIPTIONS = 16
+
+  def __init__(self) -> None:
+    self._lock = threading.Lock()
+    self._subscriptions = set()
+    self._hashes = {}
+    self._refreshed = {}
+
+  def subscribe(self, widget_ids: list[str]) -> Subscription | None:
+    """Returns a new subscription to the events of these widgets, None if
+    there are already MAX_SUBSCRIPTIONS."""
+
+    subscription = Subscription(set(widget_ids))
+    now = time.monotonic()
+    with self._lock:
+      if len(self._subscriptions) >= self.MAX_SUBSCRIPTIONS:
+        return None
+      self._subscriptions.add(subscription)
+      for widget_id in subscription.widget_ids:
+        # The page just fetched the data, so the first refresh is due
+        # after a full interval.
+        self._refreshed.setdefault(widget_id, now)
+    return subscription
+
+  def unsubscribe(self, subscription: Subscription) -> None:
+    """Removes the subscription. Widgets that no longer have subscribers
+    are forgotten."""
+
+    with self._lock:
+      self._subscriptions.discard(subscription)
+      subscribed = self._get_subscribed_widget_ids()
+      for widget_id in list(self._refreshed):
+        if widget_id not in subscribed:
+          self._refreshed.pop(widget_id, None)
+          self._hashes.pop(widget_id, None)
+
+  def get_subscribed_widget_ids(self) -> set[str]:
+    """Returns the ids of all the widgets that have subscribers."""
+    with self._lock:
+      return self._get_subscribed_widget_ids()
+
+  def is_due(self, widget_id: str, interval: int) -> bool:
+    """Returns True if the widget was last refreshed more than 'interval'
+    seconds ago, marking it as refreshed now if so."""
+
+    now = time.monotonic()
+    with self._lock:
+      refreshed = self._refreshed.get(widget_id)
+      if refreshed is not None and now - refreshed < interval:
+        return False
+      self._refreshed[widget_id] = now
+      return True
+
+  def publish(self, widget_id: str, content: CompressedContent) -> bool:
+    """Publishes the widget data (serialized, see
+    Widget.serialize_data()) to its subscribers, unless it is the same as
+    the data last published for this widget. Returns True if the data
+    was published."""
+
+    with self._lock:
+      if self._hashes.get(widget_id) == content.etag:
+        return False
+      self._hashes[widget_id] = content.etag
+      subscriptions = [ s for s in self._subscriptions if widget_id in s.widget_ids ]
+
+    # The serialized data is used as-is.
+    event = f'{{"widget_id":{dumps(widget_id)},"data":{content.content.decode()}}}'
+    for subscription in subscriptions:
+      subscription.put(event)
+    return bool(subscriptions)
+
+  def _get_subscribed_widget_ids(self) -> set[str]:
+    """Same as get_subscribed_widget_ids(), the lock must be held."""
+    widget_ids = set()
+    for subscription in self._subscriptions:
+      widget_ids.update(subscription.widget_ids)
+    return widget_ids
+
+
+#
+# Create the Event Hub
+#
+EVENTS = EventHub()
@@ -0,0 +1,285 @@
+"""The fetch engine: an asyncio event loop (running in its own thread)
+shared by all the widgets. The widgets with an 'async def fetch_data()'
+run on it and send their requests with a shared HTTP client (httpx,
+when installed) that pools the connections; the other widgets run
+unchanged in its thread pool. Any number of widgets can then be fetched
+at the same time without tying up a worker each."""
+
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import inspect
+import logging
+import threading
+import time
+
+from collections.abc import Coroutine
+
+from core.cache import CACHE
+from core.ratelimit import RATE_LIMITS, RateLimitExceeded
+from optionals import httpx
+
+
+__all__ = ["FETCH_ENGINE"]
+
+
+class FetchEngine:
+  """Runs the (async) widget fetches and sends their requests."""
+
+  # The shared HTTP client: connection pool and default timeout.
+  MAX_CONNECTIONS = 50
+  MAX_KEEPALIVE_CONNECTIONS = 10
+  TIMEOUT = 10
+
+  # Threads used to run the sync code (the sync widgets, and requests
+  # when httpx is not installed).
+  MAX_WORKERS = 16
+
+  # Retries, the same as retry_requests does for the sync widgets (see
+  # Widget.get_requests()).
+  RETRIES = 3
+  BACKOFF_FACTOR = 0.2
+  RETRY_STATUS_CODES = (500, 502, 504)
+
+  # The fetch plans (see fetch_planned()) are given up after this many
+  # rounds of requests.
+  MAX_PLAN_ROUNDS = 5
+
+  # What gets cached, the same as requests_cache.
+  CACHEABLE_METHODS = ("GET", "HEAD")
+  CACHEABLE_STATUS_CODES = (200,)
+
+  # The cached responses are kept (stale) at least this long after they
+  # expire: they are revalidated with a conditional request (ETag or
+  # Last-Modified) and served when the rate limit is exhausted.
+  STALE_DURATION = 24 * 60 * 60
+
+  # The status codes of the responses refused over the rate limit.
+  RATE_LIMITED_STATUS_CODES = (403, 429)
+
+  def __init__(self) -> None:
+    self._lock = threading.Lock()
+    self._loop = None
+    self._client = None
+
+  @property
+  def has_client(self) -> bool:
+    """Returns True if the requests can be sent asynchronously (httpx is
+    installed)."""
+    return httpx is not None
+
+  @property
+  def loop(self) -> asyncio.AbstractEventLoop:
+    """Returns the engine's event loop, starting it (and its thread) the
+    first time."""
+
+    with self._lock:
+      if self._loop is None:
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+          max_workers=self.MAX_WORKERS, thread_name_prefix="informer-fetch"))
+        threading.Thread(target=loop.run_forever, name="informer-fetch-loop", daemon=True).start()
+        self._loop = loop
+      return self._loop
+
+  def run(self, coro: Coroutine, timeout: float | None = None) -> any:
+    """Runs the coroutine on the engine's loop and returns its result.
+    This is how sync code (eg. a Flask view) calls async code, it must
+    not be called from the loop itself."""
+    return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+  async def call(self, func: callable, *args, **kwargs) -> any:
+    """Calls func from the loop: coroutine functions are awaited, the
+    other functions run in the thread pool."""
+
+    if inspect.iscoroutinefunction(func):
+      return await func(*args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+  async def fetch_planned(self, widgets: list) -> list[dict | Exception]:
+    """Runs the fetch plans of these widgets (see Widget.fetch_plan())
+    and returns, for each widget, the data built by its parse() or the
+    exception that made it fail. The requests are made in rounds: in each
+    round the new requests of all the widgets are deduplicated and made
+    at the same time. The requests that depend on other responses are
+    made in the following rounds. The widgets whose first plan is None
+    are fetched with their fetch_data() instead, at the same time."""
+
+    responses = [ {} for _ in widgets ]
+    results = [ None ] * len(widgets)
+    pending = set(range(len(widgets)))
+    unplanned = {}
+
+    for plan_round in range(self.MAX_PLAN_ROUNDS + 1):
+      # Collect the new requests: key -> (widget, request, [(index, name)])
+      batch = {}
+      for index in sorted(pending):
+        try:
+          plan = widgets[index].fetch_plan(responses[index])
+        except Exception as e:
+          results[index] = e
+          pending.discard(index)
+          continue
+
+        if plan is None and plan_round == 0:
+          unplanned[index] = asyncio.ensure_future(self.call(widgets[index].fetch_data))
+          pending.discard(index)
+          continue
+
+        plan = [ fetch_request for fetch_request in plan or [] if fetch_request.name not in responses[index] ]
+        if not plan:
+          pending.discard(index)
+        for fetch_request in plan:
+          key = widgets[index].get_fetch_request_key(fetch_request)
+          entry = batch.setdefault(key, (widgets[index], fetch_request, []))
+          entry[2].append((index, fetch_request))
+
+      if not batch or plan_round == self.MAX_PLAN_ROUNDS:
+        break
+
+      fetched = await asyncio.gather(*[
+        widget.web_fetch_async(fetch_request.method,
+                               fetch_request.url,
+                               fetch_request.allowed_status_codes,
+                               **fetch_request.kwargs)
+        for widget, fetch_request, _ in batch.values()
+      ], return_exceptions=True)
+
+      for (_, _, targets), response in zip(batch.values(), fetched):
+        for index, fetch_request in targets:
+          if isinstance(response, Exception) and not fetch_request.optional:
+            results[index] = response
+            pending.discard(index)
+          responses[index][fetch_request.name] = response
+
+    for index in pending:
+      results[index] = RuntimeError(f"The fetch plan did not complete in {self.MAX_PLAN_ROUNDS} rounds.")
+
+    data = await asyncio.gather(*unplanned.values(), return_exceptions=True)
+    for index, widget_data in zip(unplanned, data):
+      # Not parsed (see below): None is the same as no data.
+      results[index] = widget_data if widget_data is not None else {}
+
+    # Parse (CPU work) in the thread pool.
+    parsed = [ index for index, result in enumerate(results) if result is None ]
+    data = await asyncio.gather(*[
+      self.call(widgets[index].parse, responses[index]) for index in parsed
+    ], return_exceptions=True)
+    for index, widget_data in zip(parsed, data):
+      results[index] = widget_data
+
+    return results
+
+  async def request(self,
+                    method: str,
+                    url: str,
+                    cache_type: str | None = None,
+                    expire_after: int | None = None,
+                    rate_limit_key: str | None = None,
+                    **kwargs) -> "httpx.Response":
+    """Sends the request with the shared client and returns the
+    response (read). Failed requests are retried (RETRY_STATUS_CODES and
+    connection errors). The GET/HEAD responses are cached for
+    'expire_after' seconds when it is set, in the 'cache_type' bucket
+    (the widget type, see core.cache). Expired responses are revalidated
+    (a 304 reuses the cached response) and are served as they are when
+    the rate limit of the host (or of 'rate_limit_key', for the APIs
+    having several) is exhausted (see core.ratelimit), which raises
+    RateLimitExceeded otherwise."""
+
+    # The redirects are followed (or not) when sending the request.
+    follow_redirects = kwargs.pop("follow_redirects", True)
+
+    client = self._get_client()
+    request = client.build_request(method.upper(), url, **kwargs)
+    rate_limit_key = rate_limit_key or request.url.host
+
+    cache_key = None
+    stale = None
+    if expire_after and cache_type and request.method in self.CACHEABLE_METHODS:
+      cache_key = self._get_cache_key(request)
+      cached = CACHE.get_cache(cache_type, cache_key)
+      if cached is not None:
+        response, expires_ts = cached
+        if time.time() < expires_ts:
+          return response
+        stale = response
+        self._set_validation_headers(request, stale)
+
+    if RATE_LIMITS.is_exhausted(rate_limit_key):
+      if stale is not None:
+        return stale
+      reset = time.ctime(RATE_LIMITS.get_reset(rate_limit_key))
+      raise RateLimitExceeded(f"The rate limit of {rate_limit_key} is exhausted until {reset}.")
+
+    for attempt in range(self.RETRIES + 1):
+      is_last = attempt == self.RETRIES
+      try:
+        response = await client.send(request, follow_redirects=follow_redirects)
+        await response.aread()
+      except httpx.TransportError:
+        if is_last:
+          raise
+      else:
+        if is_last or response.status_code not in self.RETRY_STATUS_CODES:
+          break
+      await asyncio.sleep(self.BACKOFF_FACTOR * (2 ** attempt))
+
+    RATE_LIMITS.update(rate_limit_key, response.headers)
+
+    if stale is not None:
+      # Not modified, or refused because the rate limit was just
+      # exhausted: the cached response is still the one to use.
+      if response.status_code == 304 or (response.status_code in self.RATE_LIMITED_STATUS_CODES
+                                         and RATE_LIMITS.is_exhausted(rate_limit_key)):
+        response = stale
+
+    if cache_key is not None and response.status_code in self.CACHEABLE_STATUS_CODES:
+      CACHE.set_cache(cache_type,
+                      cache_key,
+                      [response, time.time() + expire_after],
+                      f"{expire_after + max(expire_after, self.STALE_DURATION)}s")
+
+    return response
+
+  def _get_client(self) -> "httpx.AsyncClient":
+    """Returns the shared HTTP client (created on first use, from the
+    loop)."""
+
+    if self._client is None:
+      # httpx logs every request (INFO), requests does not.
+      logging.getLogger("httpx").setLevel(logging.WARNING)
+      self._client = httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=self.TIMEOUT,
+        limits=httpx.Limits(max_connections=self.MAX_CONNECTIONS,
+                            max_keepalive_connections=self.MAX_KEEPALIVE_CONNECTIONS))
+    return self._client
+
+  def _set_validation_headers(self, request: "httpx.Request", response: "httpx.Response") -> None:
+    """Makes the request conditional on the cached response having
+    changed (unless the request already is)."""
+
+    etag = response.headers.get("ETag")
+    if etag and "If-None-Match" not in request.headers:
+      request.headers["If-None-Match"] = etag
+
+    last_modified = response.headers.get("Last-Modified")
+    if last_modified and "If-Modified-Since" not in request.headers:
+      request.headers["If-Modified-Since"] = last_modified
+
+  def _get_cache_key(self, request: "httpx.Request") -> str:
+    """Returns the cache key for this request: its method, URL (with the
+    query string) and body."""
+
+    key = f"fetch {request.method} {request.url}"
+    if request.content:
+      key = f"{key} {hashlib.md5(request.content).hexdigest()}"
+    return key
+
+
+#
+# Create the Fetch Engine
+#
+FETCH_ENGINE = FetchEngine()
@@ -1,10 +1,12 @@
 """Core functions related to files."""
 
-import hashlib
+import os
+import threading
 
+from core.compression import CompressedContent
 from core.config import Config
 from optionals import jsmin, CSSMinifier
-from templates import loader_env
+from templates import loader_env, TEMPLATES_DIR
 
 
 __all__ = ["BUNDLER"]
@@ -13,23 +15,112 @@ __all__ = ["BUNDLER"]
 class Bundler:
   """Class used for bundling CSS and JS files."""
 
+  # Bundle types rendered as templates (they depend on the theme and
+  # settings, so on the config). The other stylesheets are static and
+  # only refer to the theme through its CSS custom properties.
+  TEMPLATE_BUNDLE_TYPES = ("themecss",)
+
+  MIMETYPES = {
+    "css": "text/css",
+    "informercss": "text/css",
+    "themecss": "text/css",
+    "js": "text/javascript",
+    "informerjs": "text/javascript",
+  }
+
+  # The bundles are requested by URL (any combination of files): only
+  # this many are kept, the least recently built ones are dropped.
+  MAX_BUNDLES = 32
+
   def __init__(self):
-    pass
+    self._lock = threading.Lock()
+    self._bundles = {}
 
-  def get_bundle_hash(self, bundle_files: list, bundle_type: str) -> str:
-    """Returns the md5 hash for the file bundle."""
+  def is_valid_bundle(self, bundle_files: list | str, bundle_type: str) -> bool:
+    """Returns True if the bundle type is known and all its files
+    exist."""
 
-    bundled_text = self.load_bundle_contents(bundle_files, bundle_type)
-    md5 = hashlib.md5(b"Informer")
-    md5.update(bundled_text.encode())
-    return md5.hexdigest()
+    bundle_files = self._normalize_bundle_files(bundle_files)
+    if bundle_type not in self.MIMETYPES or not bundle_files:
+      return False
 
-  def load_bundle_contents(self, bundle_files: list, bundle_type: str) -> str:
-    """Load the contents of the bundle and return is as a single string."""
+    for filename in bundle_files:
+      path = self.get_source_path(filename, bundle_type)
+      if path is None or not os.path.isfile(path):
+        return False
+    return True
+
+  def get_bundle_hash(self, bundle_files: list, bundle_type: str) -> str:
+    """Returns the md5 hash for the file bundle."""
+    return self.get_bundle(bundle_files, bundle_type).etag
+
+  def get_bundle(self, bundle_files: list | str, bundle_type: str) -> CompressedContent:
+    """Returns the minified bundle (with its hash and compressed variants).
+    Bundles are cached and only built again when a source file changes
+    (mtime) or, for the theme stylesheet, when the config changes."""
+
+    bundle_files = self._normalize_bundle_files(bundle_files)
+    source_paths = [ self.get_source_path(filename, bundle_type) for filename in bundle_files ]
+
+    try:
+      mtimes = tuple(os.stat(path).st_mtime_ns for path in source_paths)
+    except (OSError, TypeError):
+      # A missing file (or an unknown type): nothing worth caching.
+      return CompressedContent(self.load_bundle_contents(bundle_files, bundle_type),
+                               self.MIMETYPES.get(bundle_type, "text/plain"))
+
+    generation = Config().generation if bundle_type in self.TEMPLATE_BUNDLE_TYPES else None
+    key = (tuple(bundle_files), bundle_type)
+
+    bundle_key, bundle = self._bundles.get(key, (None, None))
+    if bundle_key == (mtimes, generation):
+      return bundle
+
+    bundle = CompressedContent(self.load_bundle_contents(bundle_files, bundle_type),
+                               self.MIMETYPES[bundle_type])
+    with self._lock:
+      self._bundles.pop(key, None)
+      while len(self._bundles) >= self.MAX_BUNDLES:
+        del self._bundles[next(iter(self._bundles))]
+      self._bundles[key] = ((mtimes, generation), bundle)
+    return bundle
+
+  def _normalize_bundle_files(self, bundle_files: list | str) -> list:
+    """Returns the list of bundle files (from a list or a comma-separated
+    string), without duplicates."""
 
     if isinstance(bundle_files, str):
       bundle_files = sorted(bundle_files.split(","))
     if not isinstance(bundle_files, list):
+      return []
+    return list(dict.fromkeys(bundle_files))
+
+  def get_bundle_name(self, bundle_files: list | str, bundle_type: str) -> str:
+    """Returns the name of the bundle, as used in its URL."""
+    return f"bundle_{','.join(self._normalize_bundle_files(bundle_files))}.{bundle_type}"
+
+  def get_source_path(self, filename: str, bundle_type: str) -> str | None:
+    """Returns the path of the source file for this bundle file."""
+
+    match(bundle_type):
+      case "css":
+        return f"./static/styles/widgets/{filename}.css"
+      case "informercss":
+        return "./static/styles/informer.css"
+      case "themecss":
+        return os.path.join(TEMPLATES_DIR, "styles", "theme.css")
+      case "js":
+        return f"./static/widgets/{filename}.js"
+      case "informerjs":
+        return f"./static/{filename}.js"
+    return None
+
+  def load_bundle_contents(self, bundle_files: list, bundle_type: str) -> str:
+    """Load the contents of the bundle and return is as a single string.
+    This always builds the bundle, use get_bundle() to use the cache."""
+
+    bundle_files = self._normalize_bundle_files(bundle_files)
+    if not bundle_files:
       return ""
 
     cfg = Config()
@@ -38,28 +129,29 @@ class Bundler:
     #
     # CSS
     #
-    if bundle_type == "css":
+    if bundle_type in ("css", "informercss"):
       for filename in bundle_files:
         try:
-          template = loader_env.get_template(f"styles/widgets/{filename}.css")
-          bundled_text += f"/* {filename} */\n\n" + \
-              template.render({ "theme": cfg.theme, "settings": cfg.global_settings }) + \
-              "\n\n\n"
+          with open(self.get_source_path(filename, bundle_type)) as fp:
+            bundled_text += f"/* {filename} */\n\n" + fp.read() + "\n\n\n"
         except Exception as e:
           print(self._make_bundle_file_error_message(bundle_type, e))
 
     #
-    # Informer CSS (main styles)
+    # Theme CSS (the theme as CSS custom properties)
     #
-    elif bundle_type == "informercss":
-      for filename in bundle_files:
-        try:
-          template = loader_env.get_template(f"styles/informer.css")
-          bundled_text += f"/* informer.css */\n\n" + \
-              template.render({ "theme": cfg.theme, "settings": cfg.global_settings }) + \
-              "\n\n\n"
-        except Exception as e:
-          print(self._make_bundle_file_error_message(bundle_type, e))
+    elif bundle_type == "themecss":
+      theme = cfg.theme
+      context = {
+        "theme": theme,
+        "settings": cfg.global_settings,
+        "variables": self._get_theme_variables(theme),
+      }
+      try:
+        template = loader_env.get_template("styles/theme.css")
+        bundled_text += template.render(context)
+      except Exception as e:
+        print(self._make_bundle_file_error_message(bundle_type, e))
 
     #
     # JS
@@ -89,6 +181,17 @@ class Bundler:
 
     return self._minify_bundle(bundled_text, bundle_type)
 
+  def _get_theme_variables(self, theme: dict) -> dict:
+    """Returns the theme values to expose as CSS custom properties
+    (--theme-<name>). Only the string values are CSS values, the flags
+    are handled by the theme stylesheet itself."""
+
+    return {
+      name.replace("_", "-"): value
+      for name, value in theme.items()
+      if isinstance(value, str)
+    }
+
   def _minify_bundle(self, bundled_text: str, bundle_type: str):
     """Minify CSS or JS, depending on the bundle_type. Leave as is if the
     bundle type is not recognized."""
@@ -98,7 +201,7 @@ class Bundler:
 
     if bundle_type in ("js", "informerjs"):
       bundled_text = jsmin(bundled_text)
-    elif bundle_type in ("css", "informercss"):
+    elif bundle_type in ("css", "informercss", "themecss"):
       try:
         bundled_text = CSSMinifier(bundled_text)()
       except Exception as e:
@@ -1,41 +1,51 @@
 """Page is the core Class that creates the HTML page by combining the
 styles, css, javascript to load along with the widget HTML fragments."""
 
+import threading
+
+from core.compression import CompressedContent
 from core.files import BUNDLER
 from templates import loader_env
-from widgets import WidgetFinder
+from widgets import Widget, WidgetFinder
 
 
-__all__ = ["Page"]
+__all__ = ["Page", "PAGE_PLANS"]
 
 
 #
 # Page
 #
 class Page:
-  def __init__(self, full_config: dict, page_config: dict, theme: dict, version: str) -> None:
+  def __init__(self, full_config: dict, page_config: dict, theme: dict, version: str, slug: str = None) -> None:
     """Gather all items required to build the page (stylesheets, scripts,
-    widgets, etc)."""
+    widgets, etc). This is the compiled plan of the page: everything done
+    here only depends on the config, so a Page can be reused for as long
+    as the config does not change (see PagePlanCache)."""
 
     assert isinstance(full_config, dict)
     assert isinstance(page_config, dict)
 
     self.full_config = full_config
     self.config = page_config
+    self.slug = slug or page_config.get("slug", page_config.get("name"))
     self.title = page_config.get("title", page_config.get("name", "Page"))
     self.theme = theme
     self.version = version
 
-    # Create all widgets that belong to this page.
-    self.widgets = WidgetFinder(self.config).find_widgets()
+    # Create all widgets that belong to this page (the config itself is
+    # read-only, the instances are kept in self.widgets). The widget ids
+    # are scoped to the page as defined in the config (the page may be
+    # requested by its slug or its name).
+    scope = page_config.get("slug", page_config.get("name"))
+    self.widgets = WidgetFinder(self.config, scope=str(scope)).find_widgets()
 
     # Extract all custom script and style tags
     script_files = set()
     style_files = set()
 
     # Get styles and scripts from each widget.
-    for widget in self.widgets:
-      w = widget.get("_widget")
+    for found in self.widgets:
+      w = found.widget
       if w is None:
         continue
 
@@ -50,21 +60,33 @@ class Page:
     self.script_files = script_files
     self.style_files = style_files
 
-  @property
-  def html(self) -> str:
-    """Returns the HTML of the page."""
-
-    pages = [
+    # All defined pages (for the navigation area).
+    self.pages = [
       { "name": cfg["name"], "slug": cfg.get("slug", cfg["name"]) }
       for cfg in self.full_config.get("pages")
       if isinstance(cfg, dict) and "name" in cfg
     ]
 
+    # Bundle hashes only depend on the files in each bundle (and, for
+    # the theme stylesheet, on the config) so we compute them once.
+    self._css_hash = BUNDLER.get_bundle_hash(sorted(self.style_files), "css")
+    self._js_hash = BUNDLER.get_bundle_hash(sorted(self.script_files), "js")
+    self._informercss_hash = BUNDLER.get_bundle_hash(["informer"], "informercss")
+    self._informerjs_hash = BUNDLER.get_bundle_hash(["informer"], "informerjs")
+    self._themecss_hash = BUNDLER.get_bundle_hash(["theme"], "themecss")
+
+    # Rendered on first use (see 'content').
+    self._content = None
+
+  @property
+  def html(self) -> str:
+    """Returns the HTML of the page."""
+
     template = loader_env.get_template("widgets/page.html")
     content = template.render({
       # All defined pages (so that we can show the links in the
       # navigation area.
-      "pages": pages,
+      "pages": self.pages,
 
       # Our page title
       "title": self.title,
@@ -72,6 +94,9 @@ class Page:
       # The config consists of the entire page config tree.
       "config": self.config,
 
+      # The slug the page was requested with (active navigation link).
+      "slug": self.slug,
+
       # All script files required to be loaded for this page.
       # "script_tags": self.script_tags,
       "script_files": self.script_files,
@@ -94,26 +119,103 @@ class Page:
       "informerccs_hash": self.informercss_hash,
       "informerjs_hash": self.informerjs_hash,
       "js_hash": self.js_hash,
+      "themecss_hash": self.themecss_hash,
     })
 
     return content
 
+  @property
+  def content(self) -> CompressedContent:
+    """Returns the rendered HTML along with its ETag and precompressed
+    variants. The widgets fetch their data after the page has loaded, so
+    the HTML only depends on the compiled page: we render it once."""
+
+    if self._content is None:
+      self._content = CompressedContent(self.html, "text/html")
+    return self._content
+
   @property
   def css_hash(self):
-    filenames = sorted(self.style_files)
-    return BUNDLER.get_bundle_hash(filenames, "css")
+    return self._css_hash
 
   @property
   def js_hash(self):
-    filenames = sorted(self.script_files)
-    return BUNDLER.get_bundle_hash(filenames, "js")
+    return self._js_hash
 
   @property
   def informercss_hash(self):
-    filenames = ["informer"]
-    return BUNDLER.get_bundle_hash(filenames, "informercss")
+    return self._informercss_hash
 
   @property
   def informerjs_hash(self):
-    filenames = ["informer"]
-    return BUNDLER.get_bundle_hash(filenames, "informerjs")
+    return self._informerjs_hash
+
+  @property
+  def themecss_hash(self):
+    return self._themecss_hash
+
+
+#
+# Page Plan Cache
+#
+class PagePlanCache:
+  """Holds the compiled Page objects (widgets, validated params, script
+  and style sets, bundle hashes) for a config generation, along with the
+  widgets of these pages by widget id. Only the plans for the latest
+  generation are kept: a new generation discards the old plans."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._generation = None
+    self._pages = {}
+    self._widgets = {}
+
+  def get(self, generation: int, slug: str) -> Page | None:
+    """Returns the compiled Page for this config generation and slug, or
+    None if it has not been compiled yet."""
+
+    with self._lock:
+      if generation != self._generation:
+        return None
+      return self._pages.get(slug)
+
+  def get_widget(self, generation: int, widget_id: str) -> Widget | None:
+    """Returns the Widget with this id from the compiled pages of this
+    config generation, or None if no compiled page holds it."""
+
+    with self._lock:
+      if generation != self._generation:
+        return None
+      return self._widgets.get(widget_id)
+
+  def set(self, generation: int, slug: str, page: Page) -> Page:
+    """Stores the compiled Page and returns it. A Page compiled for an
+    older generation (by a thread that started before the config
+    changed) is returned but not stored."""
+
+    with self._lock:
+      if self._generation is not None and generation < self._generation:
+        return page
+      if generation != self._generation:
+        self._generation = generation
+        self._pages = {}
+        self._widgets = {}
+      self._pages[slug] = page
+      for found in page.widgets:
+        if found.widget is not None:
+          self._widgets.setdefault(found.id, found.widget)
+    return page
+
+  def clear(self) -> None:
+    """Removes all compiled pages."""
+
+    with self._lock:
+      self._generation = None
+      self._pages = {}
+      self._widgets = {}
+
+
+#
+# Create the Page Plan Cache
+#
+PAGE_PLANS = PagePlanCache()
@@ -0,0 +1,198 @@
+"""API rate limits. Some APIs (eg. GitHub) only allow so many requests
+per hour and report what is left in the X-RateLimit-* headers of their
+responses. The budget is kept per host in the cache directory, so that
+all the workers share it, and is used to space out the refreshes of the
+widgets and to stop sending requests once it is exhausted. The widgets
+refreshing (the consumers of a budget, in every worker) are kept there
+too."""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from core.cache import CACHE
+
+try:
+  import fcntl
+except ImportError:
+  # Windows: no flock, but only the development server (a single
+  # process) runs there.
+  fcntl = None
+
+
+__all__ = ["RATE_LIMITS", "RateLimitExceeded"]
+
+
+class RateLimitExceeded(Exception):
+  """There are no requests left for this host until its rate limit gets
+  reset."""
+  pass
+
+
+class RateLimits:
+  """The rate limit budgets (per host) reported by the APIs."""
+
+  FILENAME = "ratelimits.json"
+
+  HEADER_LIMIT = "X-RateLimit-Limit"
+  HEADER_REMAINING = "X-RateLimit-Remaining"
+  HEADER_RESET = "X-RateLimit-Reset"
+
+  # The widgets that refreshed in this window (seconds) share the budget
+  # (see get_refresh_interval()). A consumer is recorded again (in the
+  # file) once its record is this old.
+  CONSUMER_WINDOW = 60 * 60
+  CONSUMER_RECORD_INTERVAL = 5 * 60
+
+  def __init__(self, path: str = None) -> None:
+    self.path = path or os.path.join(CACHE.FULL_CACHE_DIR, self.FILENAME)
+    self._lock = threading.Lock()
+    self._data = { "limits": {}, "consumers": {} }
+    self._mtime = None
+
+  def get(self, host: str) -> dict | None:
+    """Returns the budget of this host ({ "limit", "remaining", "reset" },
+    reset being a timestamp), None if unknown or if it was reset since."""
+
+    limits = self._load()["limits"].get(host)
+    if limits is None or limits["reset"] <= time.time():
+      return None
+    return limits
+
+  def update(self, host: str, headers: dict) -> None:
+    """Records the budget reported in the headers of a response from
+    this host (if any)."""
+
+    try:
+      limits = {
+        "limit": int(headers[self.HEADER_LIMIT]),
+        "remaining": int(headers[self.HEADER_REMAINING]),
+        "reset": int(headers[self.HEADER_RESET]),
+      }
+    except (KeyError, TypeError, ValueError):
+      return
+
+    # The workers update the file in turn, each one from what the others
+    # wrote, so that no update gets lost.
+    with self._lock, self._lock_file():
+      data = self._load(reload=True)
+      if data["limits"].get(host) == limits:
+        return
+      self._save({ **data, "limits": { **data["limits"], host: limits } })
+
+  def is_exhausted(self, host: str) -> bool:
+    """Returns True if there are no requests left for this host (until
+    its reset)."""
+    limits = self.get(host)
+    return limits is not None and limits["remaining"] <= 0
+
+  def get_reset(self, host: str) -> int | None:
+    """Returns the timestamp of the next reset of the budget of this
+    host, None if unknown."""
+    limits = self.get(host)
+    return limits["reset"] if limits is not None else None
+
+  def get_refresh_interval(self, host: str, consumer: str, interval: int, cost: int = 1) -> int:
+    """Returns the refresh interval (seconds, at least 'interval') of a
+    consumer (eg. a widget id) that uses 'cost' requests per refresh, so
+    that the consumers of this host spread the remaining requests until
+    the reset instead of using them all up before it. Each worker
+    refreshes its widgets on its own (see core.events), so a consumer
+    counts once per worker."""
+
+    now = time.time()
+    consumer = f"{consumer} {os.getpid()}"
+    consumers = self._load()["consumers"].get(host, {})
+    last_seen = consumers.get(consumer)
+    if last_seen is None or now - last_seen > self.CONSUMER_RECORD_INTERVAL:
+      with self._lock, self._lock_file():
+        data = self._load(reload=True)
+        consumers = {
+          key: last_seen
+          for key, last_seen in data["consumers"].get(host, {}).items()
+          if now - last_seen <= self.CONSUMER_WINDOW
+        }
+        consumers[consumer] = now
+        self._save({ **data, "consumers": { **data["consumers"], host: consumers } })
+
+    n_consumers = sum(1 for last_seen in consumers.values() if now - last_seen <= self.CONSUMER_WINDOW)
+
+    limits = self.get(host)
+    if limits is None:
+      return interval
+
+    remaining = max(limits["remaining"], 1)
+    spread = (limits["reset"] - now) * cost * n_consumers / remaining
+    return max(interval, int(spread))
+
+  @contextlib.contextmanager
+  def _lock_file(self):
+    """Holds an exclusive lock (flock) on the lock file next to the
+    budgets, shared by the workers, while the context is active."""
+
+    if fcntl is None:
+      yield
+      return
+
+    try:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      fp = open(f"{self.path}.lock", "a")
+    except OSError as e:
+      print(f"Unable to lock the rate limits: {str(e)}")
+      yield
+      return
+
+    with fp:
+      fcntl.flock(fp, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(fp, fcntl.LOCK_UN)
+
+  def _load(self, reload: bool = False) -> dict:
+    """Returns the budgets and the consumers ({ "limits": { host: budget
+    }, "consumers": { host: { consumer: last seen } } }), loading them
+    again if the file changed (eg. written by another worker) or if
+    reload is True (the mtime may not change between two quick
+    writes)."""
+
+    try:
+      mtime = os.stat(self.path).st_mtime_ns
+    except OSError:
+      return self._data
+
+    if reload or mtime != self._mtime:
+      try:
+        with open(self.path) as fp:
+          data = json.load(fp)
+        self._data = {
+          "limits": data.get("limits") or {},
+          "consumers": data.get("consumers") or {},
+        }
+        self._mtime = mtime
+      except (OSError, ValueError, AttributeError):
+        pass
+
+    return self._data
+
+  def _save(self, data: dict) -> None:
+    """Writes the budgets and the consumers (atomically: to a temporary
+    file, then renamed over the file)."""
+
+    self._data = data
+    try:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      with open(f"{self.path}.{os.getpid()}.tmp", "w") as fp:
+        json.dump(data, fp)
+      os.replace(f"{self.path}.{os.getpid()}.tmp", self.path)
+      self._mtime = os.stat(self.path).st_mtime_ns
+    except OSError as e:
+      print(f"Unable to save the rate limits: {str(e)}")
+
+
+#
+# Create the Rate Limits
+#
+RATE_LIMITS = RateLimits()
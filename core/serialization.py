@@ -0,0 +1,66 @@
+"""JSON serialization. Uses orjson or msgspec when one of them is
+installed and falls back to the standard json module otherwise. All
+the backends produce compact JSON (no whitespace)."""
+
+import json
+
+from optionals import msgspec, orjson
+
+
+__all__ = ["BACKEND", "dumps", "dumps_bytes"]
+
+
+def _default(o: any) -> any:
+  """Objects JSON does not know about: those with a __json__() method
+  (eg. Widget) are serialized as what it returns, anything else as its
+  string representation."""
+
+  to_json = getattr(o, "__json__", None)
+  if to_json is not None:
+    return to_json()
+  return str(o)
+
+
+def _json_dumps(obj: any, sort_keys: bool) -> str:
+  """The standard json module version of dumps()."""
+  return json.dumps(obj, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False, default=_default)
+
+
+if orjson is not None:
+  BACKEND = "orjson"
+
+  def dumps_bytes(obj: any, sort_keys: bool = False) -> bytes:
+    """Returns the JSON for obj (as bytes)."""
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+      option |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, default=_default, option=option)
+
+elif msgspec is not None:
+  BACKEND = "msgspec"
+
+  _encoder = msgspec.json.Encoder(enc_hook=_default)
+  _sorted_encoder = msgspec.json.Encoder(enc_hook=_default, order="sorted")
+
+  def dumps_bytes(obj: any, sort_keys: bool = False) -> bytes:
+    """Returns the JSON for obj (as bytes)."""
+    try:
+      return (_sorted_encoder if sort_keys else _encoder).encode(obj)
+    except TypeError:
+      # msgspec only sorts dicts with str keys.
+      return _json_dumps(obj, sort_keys).encode()
+
+else:
+  BACKEND = "json"
+
+  def dumps_bytes(obj: any, sort_keys: bool = False) -> bytes:
+    """Returns the JSON for obj (as bytes)."""
+    return _json_dumps(obj, sort_keys).encode()
+
+
+def dumps(obj: any, sort_keys: bool = False) -> str:
+  """Returns the JSON for obj (as a str)."""
+
+  if BACKEND == "json":
+    return _json_dumps(obj, sort_keys)
+  return dumps_bytes(obj, sort_keys=sort_keys).decode()
@@ -1,23 +1,26 @@
 """Informer"""
 
 import argparse
-import json
-import hashlib
+import asyncio
 import os
 import signal
 import sys
 import types
 
-from flask import Flask, Response, redirect, request, url_for
+from flask import Flask, Response, redirect, request, send_file, send_from_directory, url_for
 from flask_compress import Compress
 from flask_cors import CORS
 from flask_apscheduler import APScheduler
 
+from core.assets import ASSETS
 from core.cache import CACHE
-from core.config import Config, ConfigLoadException
+from core.compression import CompressedContent
+from core.config import Config, ConfigLoadException, ConfigSnapshot
+from core.events import EVENTS
+from core.fetch import FETCH_ENGINE
 from core.files import BUNDLER
-from core.page import Page
-from templates import loader_env
+from core.page import Page, PAGE_PLANS
+from templates import enable_production_mode
 from widgets import WIDGETS_BY_TYPE, Widget, WidgetFinder
 
 
@@ -29,6 +32,8 @@ CONFIG_FILEPATH_DEFAULT = f"{os.path.join(os.path.dirname(__file__), CONFIG_FILE
 HOST_DEFAULT = "localhost"
 PORT_DEFAULT = 8080
 
+BUILD_COMMAND = "build"
+
 CACHE_COMMAND = "cache"
 CACHE_COMMAND_LIST = "list"
 CACHE_COMMAND_CLEAN = "clean"
@@ -36,10 +41,18 @@ CACHE_COMMAND_PRUNE = "prune"
 ALL_CACHE_COMMANDS = (CACHE_COMMAND_LIST, CACHE_COMMAND_CLEAN, CACHE_COMMAND_PRUNE)
 
 CACHE_CONTROL = "public, max-age=31536000, immutable"
+CACHE_CONTROL_REVALIDATE = "no-cache"
+
+# Server-Sent Events: how often the widgets with subscribers are checked
+# for a refresh, the keep-alive interval and the client reconnect delay.
+REFRESH_TICK_SECONDS = 5
+EVENTS_KEEPALIVE_SECONDS = 30
+EVENTS_RETRY_MS = 5000
 
 
-# Create the Flask App and setup CORS.
-app = Flask(__name__)
+# Create the Flask App and setup CORS. The static files are served by
+# get_static_file() (so that prebuilt assets can be used).
+app = Flask(__name__, static_folder=None)
 Compress(app)
 CORS(app)
 
@@ -55,7 +68,10 @@ def main():
 
   if args.show_config:
     widget_type = args.show_config
-    widgetCls = WIDGETS_BY_TYPE[widget_type]
+    widgetCls = WIDGETS_BY_TYPE.get(widget_type)
+    if widgetCls is None:
+      print(f"The {widget_type} widget is not available.")
+      return
 
     print(f"Here are the parameter details for the {widgetCls.__name__} widget:")
     print("")
@@ -127,11 +143,15 @@ def main():
     handle_cache_command(args)
     return
 
+  if args.command == BUILD_COMMAND:
+    handle_build_command(args)
+    return
+
   # Let's start with the version!
   print(f" * Informer v{__version__}")
   print(f" * Config file: {args.config}")
 
-  start_cache_cleanup_scheduler()
+  start_scheduler()
   app.run(host=args.host, port=args.port)
 
 
@@ -159,6 +179,8 @@ def get_argument_parser() -> argparse.ArgumentParser:
   clean_parser = cache_subparsers.add_parser(CACHE_COMMAND_CLEAN, help="Clean/Delete cached files.")
   clean_parser.add_argument("widget", nargs="?", help="Specific widget to clean.")
 
+  _ = subparsers.add_parser(BUILD_COMMAND, help="Build the minified, precompressed assets.")
+
   return parser
 
 
@@ -228,12 +250,108 @@ def handle_cache_command(args: argparse.Namespace) -> None:
     print("Invalid cache command: '{args.action}'")
 
 
-def get_config_hash(config: dict) -> str:
-  """Returns the MD5 Hash for this config."""
-  config_str = json.dumps(config, sort_keys=True, ensure_ascii=True, indent=0)
-  md5 = hashlib.md5(b"InformerConfig")
-  md5.update(config_str.encode())
-  return md5.hexdigest()
+def handle_build_command(args: argparse.Namespace) -> None:
+  """The 'build' command was used in the command-line. Write the assets
+  so that the server can send them as-is."""
+
+  print(f"\nBuilding the assets in '{ASSETS.build_dir}':")
+  try:
+    num_files = ASSETS.build(__version__)
+  except ConfigLoadException as e:
+    error = str(e)
+    error = error.replace("<pre>", "").replace("</pre>", "")
+    print(error)
+    return
+
+  print(f"\nBuilt {num_files} asset(s).")
+
+
+def send_asset(asset: dict, cache_control: str) -> Response:
+  """Returns the response for a prebuilt asset: the precompressed file
+  matching the client's Accept-Encoding, sent straight from disk."""
+
+  accepted = [ encoding for encoding, quality in request.accept_encodings if quality > 0 ]
+  encoding, path = ASSETS.get_variant(asset, accepted)
+  etag = f"{asset['hash']}-{encoding}" if encoding else asset["hash"]
+
+  response = send_file(path, mimetype=asset["mimetype"], etag=etag, conditional=True)
+  if encoding is not None:
+    # flask_compress leaves responses with a Content-Encoding alone.
+    response.headers["Content-Encoding"] = encoding
+
+  response.headers["Cache-Control"] = cache_control
+  response.headers["Vary"] = "Accept-Encoding"
+  return response
+
+
+def send_content(content: CompressedContent, cache_control: str = "no-cache") -> Response:
+  """Returns the response for precompressed content: the variant matching
+  the client's Accept-Encoding, or a 304 if the client already has the
+  content (If-None-Match)."""
+
+  accepted = [ encoding for encoding, quality in request.accept_encodings if quality > 0 ]
+  encoding, body = content.get_variant(accepted)
+
+  if content.matches(request.if_none_match.as_set(include_weak=True)):
+    response = Response(status=304)
+  else:
+    response = Response(body, mimetype=content.mimetype)
+    if encoding is not None:
+      # flask_compress leaves responses with a Content-Encoding alone.
+      response.headers["Content-Encoding"] = encoding
+
+  response.headers["ETag"] = f'"{content.get_etag(encoding)}"'
+  response.headers["Cache-Control"] = cache_control
+  response.headers["Vary"] = "Accept-Encoding"
+  return response
+
+
+def get_page_plan(snapshot: ConfigSnapshot, page: str) -> Page | None:
+  """Returns the compiled Page for this page name or slug. Returns None
+  if the page is not defined in the config."""
+
+  # The page structure only depends on the config, so we reuse the
+  # compiled page for as long as the config snapshot does not change.
+  p = PAGE_PLANS.get(snapshot.generation, page)
+  if p is not None:
+    return p
+
+  # Find the config for the desired page and instantiate the Page()
+  # object.
+  config = snapshot.data
+  pages = config.get("pages")
+  if isinstance(pages, list):
+    page_config = next((p for p in pages if isinstance(p, dict) and page in [ p.get("slug"), p.get("name") ]), None)
+  else:
+    page_config = None
+
+  if page_config is None:
+    return None
+
+  # Instantiate our Page and keep it for the next requests. The page is
+  # given the slug we are using, in case it was not defined in the
+  # config (the config snapshot itself is read-only).
+  theme = Config().theme
+  p = Page(config, page_config, theme, f"{__version__}-{snapshot.hash}", slug=page)
+  return PAGE_PLANS.set(snapshot.generation, page, p)
+
+
+def find_widget(snapshot: ConfigSnapshot, widget_id: str) -> Widget | None:
+  """Returns the Widget with this id (from the compiled pages of this
+  config snapshot). Returns None if no page of the config holds it."""
+
+  widget = PAGE_PLANS.get_widget(snapshot.generation, widget_id)
+  if widget is not None:
+    return widget
+
+  # The page holding this widget may have been compiled by another
+  # worker only: compile all the pages (once per config generation).
+  pages = snapshot.data.get("pages")
+  for page_config in pages if isinstance(pages, list) else []:
+    if isinstance(page_config, dict) and "name" in page_config:
+      get_page_plan(snapshot, page_config.get("slug", page_config["name"]))
+
+  return PAGE_PLANS.get_widget(snapshot.generation, widget_id)
 
 
 #
@@ -268,50 +386,46 @@ def get_named_page(page: str) -> str:
   Widget.USER_AGENT = user_agent
 
   try:
-    config = Config().load()
+    snapshot = Config().get_snapshot()
   except ConfigLoadException as e:
     return f"<h4>{str(e)}</h4>", 500
 
-  config_hash = get_config_hash(config)
-
-  # Find the config for the desired page and instantiate the Page()
-  # object.
-  pages = config.get("pages")
-  if isinstance(pages, list):
-    page_config = next((p for p in pages if isinstance(p, dict) and page in [ p.get("slug"), p.get("name") ]), None)
-  else:
-    page_config = None
-
-  if page_config is None:
+  p = get_page_plan(snapshot, page)
+  if p is None:
     # This page simply does not exist
     return "<h4>404 Page Not Found</h4>", 404
 
-  # In case the slug was not defined in the config, we'll set it to the
-  # value we are using.
-  page_config["slug"] = page
-  theme = Config().theme
-
-  # Instantiate our Page and return its html.
-  p = Page(config, page_config, theme, f"{__version__}-{config_hash}")
-  return p.html
+  return send_content(p.content)
 
 
 @app.route("/informer.css", methods=["GET"])
 def get_stylesheet() -> str:
-  """Returns our main stylesheet CSS. We include 'theme' in the template
-  context so that we can use this data in the template."""
+  """Returns our main stylesheet CSS."""
+
+  return bundler(["informer"], "informercss")
+
 
-  return bundler(["informercss"], "informercss")
+@app.route("/theme.css", methods=["GET"])
+def get_theme_stylesheet() -> str:
+  """Returns the theme stylesheet: the theme values as CSS custom
+  properties (used by all the other stylesheets) and the rules that
+  depend on the settings."""
+
+  return bundler(["theme"], "themecss")
 
 
 @app.route("/bundle_<bundle_files>.<bundle_type>", methods=["GET"])
 def bundler(bundle_files, bundle_type) -> Response:
   """CSS/JS bundler."""
 
-  bundled_text = BUNDLER.load_bundle_contents(bundle_files, bundle_type)
-  response = Response(bundled_text)
-  response.headers["Content-Type"] = "text/javascript" if bundle_type in ("js", "informerjs") else "text/css"
-  response.headers["Cache-Control"] = CACHE_CONTROL
+  if not BUNDLER.is_valid_bundle(bundle_files, bundle_type):
+    return { "error": f"Invalid bundle 'bundle_{bundle_files}.{bundle_type}'." }, 404
+
+  asset = ASSETS.find(BUNDLER.get_bundle_name(bundle_files, bundle_type))
+  if asset is not None:
+    response = send_asset(asset, CACHE_CONTROL)
+  else:
+    response = send_content(BUNDLER.get_bundle(bundle_files, bundle_type), CACHE_CONTROL)
   response.headers["Pragma"] = "no-cache"
   response.headers["Expires"] = "0"
 
@@ -320,70 +434,225 @@ def bundler(bundle_files, bundle_type) -> Response:
 
 @app.route("/styles/widgets/<custom_css>", methods=["GET"])
 def get_custom_stylesheet(custom_css: str) -> Response:
-  """Returns the CSS that is used by a widget. We include 'theme' in the
-  template context so that we can use this data in the template."""
-
-  cfg = Config()
-  template = loader_env.get_template(f"styles/widgets/{custom_css}")
-  response = Response(template.render({ "theme": cfg.theme, "settings": cfg.global_settings }))
-  response.headers["Content-Type"] = "text/css"
-  response.headers["Cache-Control"] = CACHE_CONTROL
-  response.headers["Pragma"] = "no-cache"
-  response.headers["Expires"] = "0"
+  """Returns the CSS that is used by a widget. The widget stylesheets are
+  static (they use the theme's CSS custom properties)."""
+
+  return get_static_file(f"styles/widgets/{custom_css}")
+
+
+@app.route("/static/<path:filename>", methods=["GET"])
+def get_static_file(filename: str) -> Response:
+  """Returns a static file, prebuilt if possible. Versioned URLs (the
+  page adds ?v= or ?h= to the files it loads) can be cached forever."""
+
+  cache_control = CACHE_CONTROL if "v" in request.args or "h" in request.args else CACHE_CONTROL_REVALIDATE
+
+  asset = ASSETS.find(f"static/{filename}")
+  if asset is not None:
+    return send_asset(asset, cache_control)
 
+  response = send_from_directory("static", filename)
+  response.headers["Cache-Control"] = cache_control
   return response
 
 
-@app.route("/widget/<widget_type>/data", methods=["POST"])
+@app.route("/widget/<widget_type>/data", methods=["GET"])
 def widget_data(widget_type: str) -> dict:
   """This method should return JSON. It is used by some widget JS to
   fetch the widget data post-load. We do the loading post-load so that
   we don't stall the initial page load with potentially blocking
-  requests."""
-
-  params = request.json
-  if not isinstance(params, dict):
-    params = {}
-  if "params" in params:
-    params = params["params"]
+  requests. The widget is identified by its id only: the widgets (and
+  their validated params) are the ones compiled from the config."""
 
   # Get widget id and make sure we return the ID with the data
-  widget_id = request.args.get("widget_id")
+  widget_id = request.args.get("id")
 
-  data = {}
+  try:
+    widget = find_widget(Config().get_snapshot(), widget_id) if widget_id else None
+  except ConfigLoadException as e:
+    widget, error = None, str(e)
+  else:
+    error = f"Invalid widget '{widget_type}' ({widget_id})."
 
-  # Make sure we can find this widget!
+  # Make sure we can find this widget, and that it is of this type (the
+  # widgets deriving from it, eg. reddit from rss, are fetched by its
+  # JS).
   widgetCls = WIDGETS_BY_TYPE.get(widget_type)
-  if widgetCls is None:
-    data["error"] = f"Invalid widget type '{widget_type}'."
+  if widget is None or widgetCls is None or not isinstance(widget, widgetCls):
+    response = app.make_response({ "error": error })
   else:
+    # The data is cached serialized and compressed (with its ETag): the
+    # refreshes get a 304 when the client already has it.
+    response = send_content(get_widget_content(widget), CACHE_CONTROL_REVALIDATE)
+
+  # The widget id is not part of the (shared) cached body.
+  response.headers["X-Widget-Id"] = widget_id or ""
+  return response
+
+
+@app.route("/widget/<widget_type>/stats", methods=["GET"])
+def widget_stats(widget_type: str) -> dict:
+  """Returns the statistics of this widget type (see Widget.get_stats()),
+  for this worker."""
+
+  widgetCls = WIDGETS_BY_TYPE.get(widget_type)
+  stats = widgetCls.get_stats() if widgetCls is not None else None
+  if stats is None:
+    return { "error": f"No statistics for '{widget_type}'." }, 404
+  return stats
+
+
+@app.route("/events", methods=["GET"])
+def widget_events() -> Response:
+  """Server-Sent Events: pushes the data of the widgets (?id=<id>, one
+  or more) whenever it changes (see refresh_widgets()). Each event is
+  { "widget_id": <id>, "data": <the JSON returned by widget_data()> }.
+  A stream holds a thread of the worker while it is open: past
+  EventHub.MAX_SUBSCRIPTIONS, the page is told (503) to poll instead."""
+
+  widget_ids = [ widget_id for widget_id in request.args.getlist("id") if widget_id ]
+  if not widget_ids:
+    return { "error": "No widgets to subscribe to." }, 400
+
+  subscription = EVENTS.subscribe(widget_ids)
+  if subscription is None:
+    # The page polls instead (see informer.js).
+    return { "error": "Too many subscribers, poll instead." }, 503
+
+  def stream():
     try:
-      widget = widgetCls(**params)
+      # Let the client know how long to wait before reconnecting.
+      yield f"retry: {EVENTS_RETRY_MS}\n\n"
+      while True:
+        event = subscription.get(timeout=EVENTS_KEEPALIVE_SECONDS)
+        if event is None:
+          # Comment line: keeps the connection (and proxies) alive.
+          yield ": keepalive\n\n"
+        else:
+          yield f"data: {event}\n\n"
+    finally:
+      EVENTS.unsubscribe(subscription)
+
+  response = Response(stream(), mimetype="text/event-stream")
+  response.headers["Cache-Control"] = "no-cache"
+  response.headers["X-Accel-Buffering"] = "no"
+  return response
+
+
+def get_widget_content(widget: Widget) -> CompressedContent:
+  """Returns the data of the widget, serialized and compressed: from the
+  cache if possible, from fetch_data() otherwise. Only the data is
+  cached (the errors are not), so a cache hit costs a lookup. The async
+  widgets and the widgets with a fetch plan are fetched on the fetch
+  engine, the others in this thread."""
 
-      cache_key = widget.get_cache_key()
-      if cache_key is not None:
-        widget_data = widget.cache_get(cache_key)
+  content = get_cached_widget_content(widget)
+  if content is not None:
+    return content
+
+  if widget.is_async or widget.has_fetch_plan:
+    return FETCH_ENGINE.run(fetch_widget_contents([widget]))[0]
+
+  try:
+    data = widget.fetch_data()
+  except Exception as e:
+    return widget.serialize_data({ "error": str(e) })
+
+  return set_widget_content(widget, data)
+
+
+async def fetch_widget_contents(widgets: list[Widget]) -> list[CompressedContent]:
+  """Same as get_widget_content(), for several widgets at the same time
+  from the fetch engine's loop. The requests of the widgets with a fetch
+  plan are made together (see FetchEngine.fetch_planned()), the sync
+  widgets run in the engine's thread pool."""
+
+  contents = [ get_cached_widget_content(widget) for widget in widgets ]
+  missing = [ widget for widget, content in zip(widgets, contents) if content is None ]
+  planned = [ widget for widget in missing if widget.has_fetch_plan ]
+  others = [ widget for widget in missing if not widget.has_fetch_plan ]
+
+  planned_data, *others_data = await asyncio.gather(
+    FETCH_ENGINE.fetch_planned(planned),
+    *[ FETCH_ENGINE.call(widget.fetch_data) for widget in others ],
+    return_exceptions=True)
+
+  if isinstance(planned_data, Exception):
+    planned_data = [ planned_data ] * len(planned)
+
+  data = dict(zip(map(id, planned), planned_data))
+  data.update(zip(map(id, others), others_data))
+
+  for index, widget in enumerate(widgets):
+    if contents[index] is None:
+      widget_data = data[id(widget)]
+      if isinstance(widget_data, Exception):
+        contents[index] = widget.serialize_data({ "error": str(widget_data) })
       else:
-        widget_data = None
+        contents[index] = set_widget_content(widget, widget_data)
 
-      if widget_data is None:
-        widget_data = widget.fetch_data()
+  return contents
 
-      if isinstance(widget_data, dict):
-        data.update(widget_data)
 
-        if cache_key is not None:
-          widget.cache_set_short(cache_key, data, widget.params["cache"] or "1m")
+def get_cached_widget_content(widget: Widget) -> CompressedContent | None:
+  """Returns the cached data of the widget (see get_widget_content()),
+  None if it is not cached."""
 
-      # data.update(widget.fetch_data())
-    except Exception as e:
-      data["error"] = str(e)
+  cache_key = widget.get_cache_key()
+  if cache_key is not None:
+    return widget.cache_get(cache_key)
+  return None
 
-  response = {}
-  response.update(data)
-  response.update({ "widget_id": widget_id })
 
-  return response
+def set_widget_content(widget: Widget, data: dict) -> CompressedContent:
+  """Serializes the data returned by fetch_data() and caches it."""
+
+  content = widget.serialize_data(data if isinstance(data, dict) else {})
+  cache_key = widget.get_cache_key()
+  if cache_key is not None and isinstance(data, dict):
+    widget.cache_set_short(cache_key, content, widget.params["cache"] or "1m")
+  return content
+
+
+#
+# Widget Refresh Task
+#
+def refresh_widgets() -> None:
+  """Refresh the widgets that have subscribers (see widget_events()) and
+  that are due for a refresh (Widget.get_refresh_interval()). The widgets are
+  fetched at the same time (on the fetch engine) and their data only
+  gets pushed if it changed."""
+
+  widget_ids = EVENTS.get_subscribed_widget_ids()
+  if not widget_ids:
+    return
+
+  try:
+    snapshot = Config().get_snapshot()
+  except ConfigLoadException:
+    return
+
+  widgets = {}
+  for widget_id in widget_ids:
+    widget = find_widget(snapshot, widget_id)
+    refresh_interval = widget.get_refresh_interval() if widget is not None else None
+    if not refresh_interval:
+      continue
+
+    if EVENTS.is_due(widget_id, refresh_interval):
+      widgets[widget_id] = widget
+
+  if widgets:
+    FETCH_ENGINE.run(publish_widgets(widgets))
+
+
+async def publish_widgets(widgets: dict[str, Widget]) -> None:
+  """Fetches the widgets (widget id: Widget) at the same time and
+  publishes their data."""
+
+  contents = await fetch_widget_contents(list(widgets.values()))
+  for widget_id, content in zip(widgets, contents):
+    EVENTS.publish(widget_id, content)
 
 
 #
@@ -394,9 +663,10 @@ def cache_cleanup() -> None:
   CACHE.clear_expired()
 
 
-def start_cache_cleanup_scheduler() -> None:
+def start_scheduler() -> None:
   scheduler = APScheduler()
   scheduler.add_job(id='Cache Cleaner', func=cache_cleanup, trigger="interval", seconds=10 * 60)
+  scheduler.add_job(id='Widget Refresh', func=refresh_widgets, trigger="interval", seconds=REFRESH_TICK_SECONDS)
   scheduler.start()
 
 
@@ -420,6 +690,7 @@ if __name__ == '__main__':
   # Development
   main()
 else:
-  # WSGI - Setup the config path
+  # WSGI - Setup the config path and compile the templates (production)
   Config(CONFIG_FILEPATH_DEFAULT)
-  start_cache_cleanup_scheduler()
+  enable_production_mode()
+  start_scheduler()
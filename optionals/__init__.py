@@ -1,6 +1,6 @@
 """Packages that may or may not be installed (not mandatory)."""
 
-__all__ = ["jsmin", "CSSMinifier"]
+__all__ = ["brotli", "httpx", "jsmin", "msgspec", "orjson", "CSSMinifier"]
 
 
 #
@@ -25,3 +25,38 @@ except ModuleNotFoundError:
 
     def __call__(self) -> str:
       return self.css
+
+
+#
+# brotli (or brotlicffi, same API). None if neither is installed.
+#
+try:
+  import brotli
+except ModuleNotFoundError:
+  try:
+    import brotlicffi as brotli
+  except ModuleNotFoundError:
+    brotli = None
+
+
+#
+# orjson and msgspec (fast JSON). None if not installed.
+#
+try:
+  import orjson
+except ModuleNotFoundError:
+  orjson = None
+
+try:
+  import msgspec
+except ModuleNotFoundError:
+  msgspec = None
+
+
+#
+# httpx (async HTTP client, see core.fetch). None if not installed.
+#
+try:
+  import httpx
+except ModuleNotFoundError:
+  httpx = None
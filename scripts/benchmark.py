@@ -0,0 +1,231 @@
+"""Benchmarks: the numbers quoted in the commit messages of the
+performance changes can be reproduced with these. They use the config
+in scripts/benchmark.yml (14 widgets on the home page) and do not fetch
+anything from the web.
+
+  python scripts/benchmark.py pages     # page plan cache, pages per second
+  python scripts/benchmark.py imports   # import time and memory
+  python scripts/benchmark.py widgets   # widget instantiation
+  python scripts/benchmark.py json      # serialization
+"""
+
+import argparse
+import copy
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_FILEPATH = os.path.join(ROOT_DIR, "scripts", "benchmark.yml")
+
+# The app uses paths relative to its directory (static files, templates).
+os.chdir(ROOT_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+
+#
+# Helpers
+#
+def load_app():
+  """Imports the app and loads the benchmark config. Importing informer
+  resets the config path, so the config is loaded after it."""
+
+  import informer
+  from core.config import Config
+
+  Config(CONFIG_FILEPATH)
+  return informer
+
+
+def time_it(func: callable, min_seconds: float = 0.5) -> float:
+  """Returns the average time (seconds) of a call to func, called for at
+  least min_seconds."""
+
+  func()
+  n = 0
+  t0 = time.perf_counter()
+  while time.perf_counter() - t0 < min_seconds:
+    for _ in range(10):
+      func()
+    n += 10
+  return (time.perf_counter() - t0) / n
+
+
+def find_widget_examples() -> dict:
+  """Returns the params of the first widget of each type in the
+  benchmark config."""
+
+  import yaml
+
+  examples = {}
+
+  def walk(obj):
+    if isinstance(obj, dict):
+      if "type" in obj and obj["type"] not in examples:
+        examples[obj["type"]] = { k: v for k, v in obj.items() if k not in ("id", "type") }
+      for value in obj.values():
+        walk(value)
+    elif isinstance(obj, list):
+      for value in obj:
+        walk(value)
+
+  with open(CONFIG_FILEPATH) as fp:
+    walk(yaml.safe_load(fp))
+
+  # The tabs are benchmarked without their widgets.
+  if "tabs" in examples:
+    examples["tabs"]["tabs"] = []
+  return examples
+
+
+#
+# Benchmarks
+#
+def bench_pages(args: argparse.Namespace) -> None:
+  """Compiling and rendering a page vs rendering its cached plan, and
+  the pages served per second (Flask test client)."""
+
+  informer = load_app()
+  from core.config import Config
+  from core.page import Page
+
+  # Compiling a page may add the widgets to its config: each one gets a
+  # copy of the config as loaded.
+  config = copy.deepcopy(Config().load())
+  theme = Config().theme
+
+  def compile_and_render():
+    config_copy = copy.deepcopy(config)
+    return Page(config_copy, config_copy["pages"][0], theme, "v").html
+
+  config_copy = copy.deepcopy(config)
+  page = Page(config_copy, config_copy["pages"][0], theme, "v")
+  compiled = time_it(compile_and_render)
+  cached = time_it(lambda: page.html)
+  print(f"compile + render:   {compiled * 1000:8.2f} ms/page")
+  print(f"cached plan render: {cached * 1000:8.2f} ms/page (x{compiled / cached:.1f})")
+
+  client = informer.app.test_client()
+  response = client.get("/home")
+  assert response.status_code == 200, response.data[:300]
+
+  per_page = time_it(lambda: client.get("/home", headers={ "Accept-Encoding": "identity" }), 2.0)
+  print(f"end-to-end:         {1 / per_page:8.1f} pages/s ({per_page * 1000:.2f} ms/page)")
+
+
+def bench_imports(args: argparse.Namespace) -> None:
+  """The time and memory (max RSS) taken to import the app, in fresh
+  interpreters, then the cost of each widget type's first use."""
+
+  measure = (
+    "import resource, time, os\n"
+    "t0 = time.perf_counter()\n"
+    "import {module}\n"
+    "dt = time.perf_counter() - t0\n"
+    "print(f'{{dt * 1000:.0f}} {{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}}', flush=True)\n"
+    "os._exit(0)\n"
+  )
+
+  for module in ("widgets", "informer"):
+    runs = []
+    for _ in range(args.runs):
+      output = subprocess.run([sys.executable, "-c", measure.format(module=module)],
+                              cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout
+      runs.append([ float(value) for value in output.split()[-2:] ])
+    times = sorted(run[0] for run in runs)
+    print(f"import {module:10s} {times[0]:6.0f}-{times[-1]:.0f} ms, {max(run[1] for run in runs):.0f} MB")
+
+  first_use = (
+    "import time, os\n"
+    "from widgets import WIDGETS_BY_TYPE\n"
+    "for widget_type in sorted(WIDGETS_BY_TYPE):\n"
+    "  t0 = time.perf_counter()\n"
+    "  WIDGETS_BY_TYPE.get(widget_type)\n"
+    "  print(f'first use of {widget_type:12s} {(time.perf_counter() - t0) * 1000:8.2f} ms', flush=True)\n"
+    "os._exit(0)\n"
+  )
+  print(subprocess.run([sys.executable, "-c", first_use],
+                       cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout, end="")
+
+
+def bench_widgets(args: argparse.Namespace) -> None:
+  """Widget instantiations per second, and the time spent handling the
+  arguments (_init_args()) per instance."""
+
+  load_app()
+  from widgets import WIDGETS_BY_TYPE
+
+  examples = find_widget_examples()
+  for widget_type in sorted(examples):
+    widgetCls = WIDGETS_BY_TYPE.get(widget_type)
+    if widgetCls is None:
+      print(f"{widget_type:12s} (not available)")
+      continue
+
+    params = examples[widget_type]
+    widget = widgetCls(**params)
+    per_instance = time_it(lambda: widgetCls(**params), 0.3)
+    per_init_args = time_it(widget._init_args, 0.3)
+    print(f"{widget_type:12s} {1 / per_instance:10.0f} instances/s   _init_args {per_init_args * 1e6:6.2f} us")
+
+
+def bench_json(args: argparse.Namespace) -> None:
+  """The serialization of the params embedded in the page, of a widget
+  payload and of the config hash: the standard json module vs the
+  backend in use (see core.serialization)."""
+
+  informer = load_app()
+  from core import config as core_config
+  from core.config import Config
+  from core.page import PAGE_PLANS
+  from core.serialization import BACKEND, dumps
+
+  informer.app.test_client().get("/home")
+  snapshot = Config().get_snapshot()
+  page = PAGE_PLANS.get(snapshot.generation, "home")
+  widgets = [ found.widget for found in page.widgets if found.widget is not None ]
+
+  payload = {
+    "html": "".join(f"<li><a href='https://example.com/{i}'>Item number {i}</a></li>" for i in range(300)),
+    "items": [ { "title": f"t{i}", "n": i, "x": i / 3 } for i in range(200) ],
+  }
+
+  results = [
+    (f"configArgs ({len(widgets)} widgets)", lambda: [ widget.params.configArgs for widget in widgets ]),
+    ("payload (json)", lambda: json.dumps(payload, sort_keys=True, separators=(",", ":"))),
+    (f"payload ({BACKEND})", lambda: dumps(payload, sort_keys=True)),
+  ]
+  if hasattr(core_config, "get_config_hash"):
+    results.append(("config hash", lambda: core_config.get_config_hash(snapshot.data)))
+
+  print(f"backend: {BACKEND}, payload {len(dumps(payload))} bytes")
+  for name, func in results:
+    print(f"{name:28s} {time_it(func, 0.3) * 1e6:8.2f} us")
+
+
+BENCHMARKS = {
+  "pages": bench_pages,
+  "imports": bench_imports,
+  "widgets": bench_widgets,
+  "json": bench_json,
+}
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Informer benchmarks.")
+  parser.add_argument("benchmark", choices=BENCHMARKS.keys(), help="The benchmark to run.")
+  parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per import (imports).")
+  args = parser.parse_args()
+
+  BENCHMARKS[args.benchmark](args)
+
+  # The app's scheduler and fetch engine threads would keep us alive.
+  sys.stdout.flush()
+  os._exit(0)
+
+
+if __name__ == "__main__":
+  main()
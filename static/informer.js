@@ -116,14 +116,24 @@ window.addEventListener('load', (event) => {
       this._fetchData(true);
     }
 
+    /*
+    ** The server pushes the widget's data whenever it changes (Server-Sent
+    ** Events). Polling every 'seconds' is only used when this is not
+    ** available.
+    */
     setRefreshInterval(seconds) {
+      this._log("Setting Refresh Interval to " + seconds.toString() + " second" + (seconds != 1 ? "s" : "") + ".");
+      informer.subscribeWidget(this, seconds);
+    }
+
+    startPolling(seconds) {
       var fn = ((ctx) => {
         return () => {
           ctx.refresh();
         }
       })(this);
 
-      this._log("Setting Refresh Interval to " + seconds.toString() + " second" + (seconds != 1 ? "s" : "") + ".");
+      this._log("Polling every " + seconds.toString() + " second" + (seconds != 1 ? "s" : "") + ".");
       setInterval(fn, seconds * 1000);
     }
 
@@ -296,6 +306,11 @@ window.addEventListener('load', (event) => {
       this.widgets = {};
       this.widgetClasses = {};  // loaded class definitions will be stored here.
       this.widgetParams = {};
+      this.subscribedWidgets = {};  // widget id -> widget (Server-Sent Events)
+      this.eventSource = undefined;
+      this.eventSourceRefused = false;  // poll instead (see subscribeWidget())
+      this._subscribeTimeout = undefined;
+      this.subscribeDelay = 1000;  // ms, see subscribeWidget()
       this._curWidgetID = 0;
       this.theme = {};
       this.initApp();
@@ -426,20 +441,19 @@ window.addEventListener('load', (event) => {
       this.widgets[widgetType] = createdWidgets;
     }
 
-    fetchWidgetData(widget) {
-      var params = {};
-      for(var k in widget.params) if(widget.params.hasOwnProperty(k) && k != "fetch") {
-        params[k] = widget.params[k];
-      }
+    /*
+    ** The server keeps the widgets (and their parameters) found in the
+    ** config: the data is requested with the widget's id only. The id
+    ** is the WID without its "wid-" prefix.
+    */
+    getWidgetId(widget) {
+      return (this.getWIDFromNode(widget.node) || "").replace(/^wid-/, "");
+    }
 
-      const encodedParams = JSON.stringify(params);
-      const fetchOptions = {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ params: params }),
-      };
+    fetchWidgetData(widget) {
+      const id = this.getWidgetId(widget);
 
-      fetch("/widget/" + widget.widget_type + "/data?widget_id=" + encodeURIComponent(widget.widget_id), fetchOptions)
+      fetch("/widget/" + widget.widget_type + "/data?id=" + encodeURIComponent(id))
         .then(response => response.json())
         .then(data => {
           widget.receivingData(data);
@@ -449,6 +463,69 @@ window.addEventListener('load', (event) => {
         })
     }
 
+    /*
+    ** Subscribe to the widget's data updates. All the widgets share a
+    ** single connection: the subscriptions are batched (the connection
+    ** is opened subscribeDelay ms after the last one), a widget that
+    ** subscribes later reopens it once for its whole batch.
+    */
+    subscribeWidget(widget, seconds) {
+      const id = this.getWidgetId(widget);
+      if(!id || typeof(EventSource) == "undefined" || this.eventSourceRefused) {
+        widget.startPolling(seconds);
+        return;
+      }
+
+      widget.refreshSeconds = seconds;
+      if(this.subscribedWidgets[id] === widget) {
+        return;
+      }
+      this.subscribedWidgets[id] = widget;
+
+      clearTimeout(this._subscribeTimeout);
+      this._subscribeTimeout = setTimeout(() => this._openEventSource(), this.subscribeDelay);
+    }
+
+    _openEventSource() {
+      if(this.eventSource) {
+        this.eventSource.close();
+      }
+
+      const query = Object.keys(this.subscribedWidgets).map(id => "id=" + encodeURIComponent(id)).join("&");
+      const eventSource = new EventSource("/events?" + query);
+
+      eventSource.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        const widget = this.subscribedWidgets[message.widget_id];
+        if(widget) {
+          widget.receivingData(message.data);
+        }
+      };
+
+      eventSource.onerror = () => {
+        // The browser reconnects on its own, unless the server refused
+        // the subscription: poll instead.
+        if(eventSource.readyState == EventSource.CLOSED) {
+          this._fallbackToPolling(eventSource);
+        }
+      };
+
+      this.eventSource = eventSource;
+    }
+
+    _fallbackToPolling(eventSource) {
+      if(this.eventSource !== eventSource) {
+        return;
+      }
+
+      console.log("[ Informer ] Server-Sent Events unavailable, polling instead.");
+      const widgets = Object.values(this.subscribedWidgets);
+      this.eventSource = undefined;
+      this.eventSourceRefused = true;
+      this.subscribedWidgets = {};
+      widgets.forEach(widget => widget.startPolling(widget.refreshSeconds));
+    }
+
     setWidgetError(widget, error_message) {
       this.addClass(widget.node, "widget-error");
       widget.node.innerHTML = `<div>${error_message}</div>`;
@@ -19,6 +19,12 @@ InformerOnLoad(() => {
 
       this.updateWidget();
 
+      // Subscribe with the other widgets of the page (a single
+      // connection), the server times the refreshes.
+      this.setRefreshInterval(5 * 60);
+    }
+
+    startPolling(seconds) {
       // Syncronize the refresh Interval to execute 1 seconds after
       // the "marker".
       const sync_marker = 300; // 5-minute mark
@@ -26,11 +32,10 @@ InformerOnLoad(() => {
       const next_marker = now - parseInt(now % sync_marker) + sync_marker;
       const seconds_to_next_marker = next_marker - now;
 
-      const fn = ((widget) => {
-        return function() {
-          widget.setRefreshInterval(5 * 60);
-        }
-      })(this);
+      const fn = () => {
+        this.refresh();
+        super.startPolling(seconds);
+      };
 
       const delay = Math.max(0, (seconds_to_next_marker + 1));
       setTimeout(fn, delay * 1000);
@@ -64,8 +69,44 @@ InformerOnLoad(() => {
       return "${hour:12}:${minute:0} ${ampm}";
     }
 
+    getOffsetSeconds() {
+      // The offset between the widget's timezone and the browser's, for
+      // the current time (so that it follows the DST changes). The
+      // offset computed by the server (when the page was built) is only
+      // used if the browser does not know the timezone.
+      const timezone = this.params.timezone;
+      if(!timezone) {
+        return this.params.offset_seconds;
+      }
+
+      try {
+        if(this.tz_formatter === undefined) {
+          this.tz_formatter = new Intl.DateTimeFormat("en-US", {
+            timeZone: timezone,
+            hourCycle: "h23",
+            year: "numeric", month: "numeric", day: "numeric",
+            hour: "numeric", minute: "numeric", second: "numeric"
+          });
+        }
+
+        const now = new Date();
+        now.setMilliseconds(0);
+
+        const parts = {};
+        for(const part of this.tz_formatter.formatToParts(now)) {
+          parts[part.type] = part.value;
+        }
+
+        const tz_date = new Date(parts.year, parts.month - 1, parts.day, parts.hour, parts.minute, parts.second);
+        return Math.round((tz_date.getTime() - now.getTime()) / 1000);
+      }
+      catch(e) {
+        return this.params.offset_seconds;
+      }
+    }
+
     updateWidget(do_next) {
-      var currentDate = new Date(Date.now() + (this.params.offset_seconds * 1000));
+      var currentDate = new Date(Date.now() + (this.getOffsetSeconds() * 1000));
       this.date.innerText = this.formatter.formatDate(currentDate, this.getDateFormat())
 
       if(this.params.time === true) {
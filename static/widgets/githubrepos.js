@@ -0,0 +1,19 @@
+/* GitHub Repositories JS */
+
+InformerOnLoad(() => {
+
+  class GitHubRepos extends informer.Widget {
+    start() {
+      this.setupDomFields([
+        ["content", ".githubrepos-content"]
+      ]);
+    }
+
+    receiveData(data) {
+      this.content.innerHTML = data.html;
+    }
+  }
+
+  informer.createWidgetsForClass(GitHubRepos);
+
+});
@@ -36,6 +36,48 @@ InformerOnLoad(() => {
       }
     }
 
+    _decode_series(series, local_time) {
+      // The series are columnar: the timestamp (seconds) of the first
+      // value, the interval (seconds) between the values, and the values.
+      // The downsampled series (see 'maxpoints') have the indexes of their
+      // values as well.
+      const points = [];
+      const values = series?.values || [];
+      const indexes = series?.indexes || null;
+
+      for(var i = 0, il = values.length; i < il; i++) {
+        const index = indexes != null ? indexes[i] : i;
+        points.push({ x: local_time((series.start + index * series.interval) * 1000), y: values[i] });
+      }
+      return points;
+    }
+
+    _make_local_time(timezone) {
+      // Returns a function converting a timestamp (ms) to the same date
+      // and time (in the widget's timezone) in the browser's timezone,
+      // which is the one the chart displays.
+      var formatter;
+      try {
+        formatter = new Intl.DateTimeFormat("en-US", {
+          timeZone: timezone,
+          hourCycle: "h23",
+          year: "numeric", month: "numeric", day: "numeric",
+          hour: "numeric", minute: "numeric"
+        });
+      }
+      catch(e) {
+        return (ts) => ts;
+      }
+
+      return (ts) => {
+        const parts = {};
+        for(const part of formatter.formatToParts(new Date(ts))) {
+          parts[part.type] = part.value;
+        }
+        return new Date(parts.year, parts.month - 1, parts.day, parts.hour, parts.minute).getTime();
+      };
+    }
+
     _make_chart_config(data, units) {
       var i, il, d;
 
@@ -85,28 +127,19 @@ InformerOnLoad(() => {
       var label_precipitation = "Precipitation";
       var precipitation_units = "mm";
 
-      // Hourly
-      for(i = 0, il = hourly_data.temperature.length; i < il; i++) {
-        var d = hourly_data.temperature[i];
-        temperature.push({ x: d[0], y: d[1] });
-      }
+      const local_time = this._make_local_time(data?.timezone);
 
-      for(i = 0, il = hourly_data.precipitation.length; i < il; i++) {
-        var d = hourly_data.precipitation[i];
-        precip_mm.push({ x: d[0], y: d[1] });
-      }
+      // Hourly
+      temperature = this._decode_series(hourly_data.temperature, local_time);
+      precip_mm = this._decode_series(hourly_data.precipitation, local_time);
 
       // Daily
-      for(i = 0, il = daily_data.temperature_max.length; i < il; i++) {
-        var d = daily_data.temperature_max[i];
-        daily_max.push({ x: d[0], y: d[1] });
-      }
+      daily_max = this._decode_series(daily_data.temperature_max, local_time);
+      daily_min = this._decode_series(daily_data.temperature_min, local_time);
 
-      for(i = 0, il = daily_data.temperature_min.length; i < il; i++) {
-        var d = daily_data.temperature_min[i];
-        var idx = daily_min.length;
-        daily_min.push({ x: d[0], y: d[1] });
-        daily_minmax.push({ x: d[0], y: [d[1], daily_max[idx].y] });
+      for(i = 0, il = daily_min.length; i < il; i++) {
+        d = daily_min[i];
+        daily_minmax.push({ x: d.x, y: [d.y, daily_max[i]?.y] });
       }
 
       num_days = daily_max.length - 1;
@@ -1,3 +1,3 @@
-from .loader import loader_env
+from .loader import loader_env, enable_production_mode, TEMPLATES_DIR
 
-__all__ = ["loader_env"]
+__all__ = ["loader_env", "enable_production_mode", "TEMPLATES_DIR"]
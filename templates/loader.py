@@ -1,15 +1,27 @@
+import os
 import re
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from platformdirs import user_cache_dir
 from .htmlcolors import HTML_COLORS
 
 
-__all__ = ["loader_env"]
+__all__ = ["loader_env", "enable_production_mode", "TEMPLATES_DIR"]
 
 
+# The templates are found relative to this package (not the current
+# working directory).
+TEMPLATES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Production mode: the templates found in these directories are compiled
+# at startup and their bytecode is cached on disk (shared by all the
+# workers, so that only the first one to start compiles them).
+PRECOMPILED_TEMPLATE_DIRS = ("widgets", "styles")
+BYTECODE_CACHE_DIR = os.path.join(user_cache_dir("informer", "informer"), "templates")
+
 re_hex_color = re.compile(r'^#?([0-9a-fA-F]{6}|[0-9a-fA-F]{8})$')
 re_measurement = re.compile(r'^(\d+)(px|em|rem|%|vh|vw)')
-loader_env = Environment(loader=FileSystemLoader("./templates"))
+loader_env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
 
 DEFAULT_COLOR_WHEN_INVALID = HTML_COLORS["TOMATO"]
 ACCEPT_COLORS = [
@@ -130,6 +142,34 @@ def short_value(value: int | None) -> str | None:
   return ret_val.replace(".0", "")
 
 
+#
+# Production mode
+#
+def enable_production_mode() -> int:
+  """Turns off the template auto-reload (no more stat() of the template
+  files on every get_template()), enables the bytecode cache and
+  compiles all the templates. Returns the number of templates compiled.
+  Changes to the templates require a restart in this mode."""
+
+  try:
+    os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+    loader_env.bytecode_cache = FileSystemBytecodeCache(BYTECODE_CACHE_DIR)
+  except OSError as e:
+    print(f"Unable to use the template bytecode cache: {str(e)}")
+
+  loader_env.auto_reload = False
+
+  template_names = loader_env.list_templates(filter_func=_is_precompiled)
+  for template_name in template_names:
+    loader_env.get_template(template_name)
+  return len(template_names)
+
+
+def _is_precompiled(template_name: str) -> bool:
+  """Template filter: templates compiled by enable_production_mode()."""
+  return template_name.split("/")[0] in PRECOMPILED_TEMPLATE_DIRS
+
+
 #
 # Assign custom filters
 #
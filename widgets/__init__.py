@@ -1,38 +1,23 @@
-import inspect
+import hashlib
+import importlib
+import threading
 
+from collections.abc import Mapping
 
-__all__ = ["load_widget", "WidgetFinder"]
+from core.serialization import dumps_bytes
 
 
-# Import the base Widget class and all other valid widgets here. They
-# are only considered valid widgets if they are imported here.
+__all__ = ["load_widget", "FoundWidget", "PageWidgets", "WidgetFinder", "WIDGETS_BY_TYPE"]
+
+
+# Import the base Widget class here. The widgets themselves are imported
+# on first use (see WIDGETS_BY_TYPE).
 from .widget import (
   Widget,
   WidgetArgumentException,
   WidgetArgumentValueException,
   WidgetInitException
 )
-from .chucknorris import *
-from .date import *
-from .garfield import *
-from .gitea import *
-from .github import *
-from .lobsters import *
-from .reddit import *
-from .ronswanson import *
-from .rss import *
-from .sitestatus import *
-from .tabs import *
-from .youtube import *
-from .xkcd import *
-
-
-# The following require extra libs to be installed. These will
-# automatically get excluded if we cannot import them.
-try:
-  from .openmeteo import *
-except ModuleNotFoundError:
-  print("Disabled 'openmeteo' Widget -> Missing required dependency.\n")
 
 
 #
@@ -48,12 +33,80 @@ class WidgetException(Widget):
   ]
 
 
-# Create a mapping of all valid widgets -> name: class
-WIDGETS_BY_TYPE = {}
-for n in dir():
-  o = globals()[n]
-  if inspect.isclass(o) and issubclass(o, Widget) and o is not Widget and o is not WidgetException:
-    WIDGETS_BY_TYPE[o.__name__.lower()] = o
+#
+# Widget Registry
+# All valid widgets -> type: (module, class name). They are only
+# considered valid widgets if they are listed here.
+#
+WIDGET_MODULES = {
+  "chucknorris": ("chucknorris", "ChuckNorris"),
+  "date": ("date", "Date"),
+  "garfield": ("garfield", "Garfield"),
+  "gitea": ("gitea", "Gitea"),
+  "github": ("github", "GitHub"),
+  "githubrepos": ("githubrepos", "GitHubRepos"),
+  "lobsters": ("lobsters", "Lobsters"),
+  "openmeteo": ("openmeteo", "OpenMeteo"),
+  "reddit": ("reddit", "Reddit"),
+  "ronswanson": ("ronswanson", "RonSwanson"),
+  "rss": ("rss", "RSS"),
+  "sitestatus": ("sitestatus", "SiteStatus"),
+  "tabs": ("tabs", "Tabs"),
+  "xkcd": ("xkcd", "xkcd"),
+  "youtube": ("youtube", "YouTube"),
+}
+
+
+class WidgetRegistry(Mapping):
+  """Mapping of the widget types to their classes. A widget module is
+  only imported the first time its type is used, so that the widgets
+  (and their dependencies) that are not in the config cost nothing."""
+
+  def __init__(self, modules: dict[str, tuple[str, str]]) -> None:
+    self._modules = modules
+    self._classes = {}
+    self._disabled = set()
+    self._lock = threading.Lock()
+
+  def __getitem__(self, widget_type: str) -> type[Widget]:
+    widgetCls = self._classes.get(widget_type)
+    if widgetCls is None:
+      widgetCls = self._import(widget_type)
+    return widgetCls
+
+  def __iter__(self):
+    return iter(self._modules)
+
+  def __len__(self) -> int:
+    return len(self._modules)
+
+  def __contains__(self, widget_type: object) -> bool:
+    return widget_type in self._modules
+
+  def _import(self, widget_type: str) -> type[Widget]:
+    """Imports the widget module and returns the class. Raises KeyError
+    if the type is not valid or its module cannot be imported."""
+
+    if widget_type not in self._modules or widget_type in self._disabled:
+      raise KeyError(widget_type)
+
+    module_name, class_name = self._modules[widget_type]
+    with self._lock:
+      try:
+        module = importlib.import_module(f".{module_name}", __name__)
+      except ModuleNotFoundError:
+        # Some widgets require extra libs to be installed. These will
+        # automatically get excluded if we cannot import them.
+        print(f"Disabled '{widget_type}' Widget -> Missing required dependency.\n")
+        self._disabled.add(widget_type)
+        raise KeyError(widget_type)
+
+      widgetCls = getattr(module, class_name)
+      self._classes[widget_type] = widgetCls
+    return widgetCls
+
+
+WIDGETS_BY_TYPE = WidgetRegistry(WIDGET_MODULES)
 
 
 def load_widget(widget_type: str, **kwargs):
@@ -79,43 +132,107 @@ def load_widget(widget_type: str, **kwargs):
   return None
 
 
+#
+# Found Widgets
+# The config entries are shared (and read-only), so the widget ids and
+# instances are kept in these per-page structures instead.
+#
+class FoundWidget:
+  """A widget found in a config: its id (stable, see WidgetFinder), its
+  config entry and the instantiated Widget (None if the type is not
+  valid)."""
+
+  def __init__(self, widget_id: str, config: dict, widget: Widget | None) -> None:
+    self.id = widget_id
+    self.config = config
+    self.widget = widget
+
+  def __repr__(self) -> str:
+    return f"FoundWidget-{self.id}-{self.widget}"
+
+
+class PageWidgets:
+  """All the widgets found for a page, in order. The instantiated Widget
+  for a config entry can be retrieved with get()."""
+
+  def __init__(self, found: list[FoundWidget]) -> None:
+    self.found = found
+
+    # Keyed by the identity of the config entry: the entries are kept
+    # alive by self.found, so the ids remain valid.
+    self._by_config = { id(f.config): f for f in found }
+
+  def __iter__(self):
+    return iter(self.found)
+
+  def __len__(self) -> int:
+    return len(self.found)
+
+  def get(self, widget_config: dict) -> Widget | None:
+    """Returns the Widget created for this config entry (or None)."""
+    found = self._by_config.get(id(widget_config))
+    return found.widget if found is not None else None
+
+
 #
 # Widget Finder
 # Used to find all widgets defined within a config.
 #
 class WidgetFinder:
-  def __init__(self, config: dict):
-    """Use this class to find widgets within a config. Using find_widget()
-    will add '_widget' to the existing widget entry in the config
-    structure. The value of _widget will be the instantiated Widget."""
+  def __init__(self, config: dict, scope: str = ""):
+    """Use this class to find widgets within a config. The config is not
+    modified: find_widgets() returns a PageWidgets holding the widget ids
+    and instantiated Widgets.
+
+    The widget ids are derived from the scope (eg. the page slug), the
+    location of the widget within the config and its definition: they
+    are the same in every process for as long as the config does not
+    change."""
 
     assert isinstance(config, dict)
     self.config = config
-    self._widget_id = 0
+    self.scope = scope
 
-  def find_widgets(self, config: dict = None):
+  def find_widgets(self, config: dict = None) -> PageWidgets:
+    """Returns all widgets found in the supplied config."""
+    page_widgets = PageWidgets(self._find_widgets(config if config is not None else self.config, ()))
+
+    # Container widgets (such as Tabs) need to get to the widgets found
+    # within them.
+    for found in page_widgets:
+      if found.widget is not None:
+        found.widget.page_widgets = page_widgets
+
+    return page_widgets
+
+  def get_widget_id(self, path: tuple, widget_config: dict) -> str:
+    """Returns the id of the widget defined by widget_config, found at
+    this path (keys and indexes) within the config."""
+
+    key = dumps_bytes([self.scope, path, widget_config], sort_keys=True)
+    return hashlib.md5(key).hexdigest()[:16]
+
+  def _find_widgets(self, config: dict, path: tuple) -> list[FoundWidget]:
     """Returns a list of all widgets found in the supplied config."""
     widgets = []
 
-    if config is None:
-      config = self.config
-
     if isinstance(config, dict):
       for k, v in config.items():
         if k == "widgets":
           if isinstance(v, list):
-            for widget in v:
+            for i, widget in enumerate(v):
               if not isinstance(widget, dict):
                 continue
-              self._widget_id += 1
-              widget["id"] = self._widget_id
+              widget_id = self.get_widget_id((*path, k, i), widget)
               args = { k: v for k, v in widget.items() if k not in ("id", "type") }
-              widget["_widget"] = load_widget(widget.get("type"), **args)
-              widgets.append(widget)
+              widget_obj = load_widget(widget.get("type"), **args)
+              if widget_obj is not None:
+                widget_obj.widget_id = widget_id
+              widgets.append(FoundWidget(widget_id, widget, widget_obj))
         if isinstance(v, dict):
-          widgets.extend(self.find_widgets(v))
+          widgets.extend(self._find_widgets(v, (*path, k)))
         elif isinstance(v, list):
-          for item in v:
-            widgets.extend(self.find_widgets(item))
+          for i, item in enumerate(v):
+            widgets.extend(self._find_widgets(item, (*path, k, i)))
 
     return widgets
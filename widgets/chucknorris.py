@@ -2,7 +2,7 @@
 
 import random
 
-from .widget import Widget, WidgetFetchDataException
+from .widget import FetchRequest, Widget
 
 
 __all__ = ["ChuckNorris"]
@@ -37,33 +37,36 @@ class ChuckNorris(Widget):
     on multiple pages it will still find the cache."""
     return self.classname
 
-  def fetch_data(self):
+  def fetch_plan(self, responses: dict) -> list[FetchRequest]:
     """Chuck Norris can roundhouse-kick fetched data in the face... with
-    his fist."""
+    his fist. The category list first, then a joke from one of them."""
 
     headers = self.make_fetch_headers()
 
     # Retrieve the category list
-    response = self.web_fetch("GET",
-                              self.URL_CATEGORIES,
-                              headers=headers,
-                              timeout=2,
-                              cache_duration=self.CACHE_DURATION_1Y)
-
-    if response.ok:
+    if "categories" not in responses:
+      return [
+        FetchRequest("categories",
+                     self.URL_CATEGORIES,
+                     headers=headers,
+                     timeout=2,
+                     cache_duration=self.CACHE_DURATION_1Y,
+                     optional=True)
+      ]
+
+    response = responses["categories"]
+    if not isinstance(response, Exception):
       categories = response.json()
       if not self.params["explicit"] and "explicit" in categories:
         categories.remove("explicit")
     else:
       categories = []
 
-    category = random.choice(categories)
+    category = random.choice(categories) if categories else None
 
     qs = f"?category={category}" if category else ""
-    response = self.web_fetch("GET", self.URL + qs, headers=headers, timeout=2)
-
-    if not response.ok:
-      raise WidgetFetchDataException(f"Failed to fetch the feed: {self.URL + qs}")
+    return [ FetchRequest("joke", self.URL + qs, headers=headers, timeout=2) ]
 
-    results = response.json()
-    return results
+  def parse(self, responses: dict) -> dict:
+    """The joke."""
+    return responses["joke"].json()
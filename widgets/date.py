@@ -29,6 +29,7 @@ class Date(Widget):
 
   SCRIPT = True
   STYLES = False
+  REFRESH_INTERVAL = 5 * 60
 
   def init(self):
     """Initialize out widget according to the parameters supplied."""
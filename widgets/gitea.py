@@ -1,9 +1,7 @@
 """Widget: Gitea"""
 
-import pendulum
-
-from templates import loader_env
-from .widget import Widget, WidgetFetchDataException, WidgetInitException
+from .repository import RepositoryWidget
+from .widget import Widget, WidgetInitException
 
 
 __all__ = ["Gitea"]
@@ -12,8 +10,8 @@ __all__ = ["Gitea"]
 #
 # Gitea Widget
 #
-class Gitea(Widget):
-  """GitHub Repository Information"""
+class Gitea(RepositoryWidget):
+  """Gitea Repository Information"""
 
   ARGUMENTS = Widget.MAKE_ARGUMENTS(
     [
@@ -30,14 +28,14 @@ class Gitea(Widget):
     ignore=["name"]
   )
 
-  SCRIPT = True
   STYLES = 'github'
   WIDGET_CLASS_NAME = "github"
-  POST_FETCH = True
   URI_BASE = "/api/v1/repos"
 
   CONTENT_TEMPLATE = "widgets/gitea_body.html"
 
+  REPOSITORY_DATE_FIELDS = ("created_at", "updated_at", "archived_at")
+
   def init(self):
     """Validate the parameters."""
 
@@ -49,94 +47,20 @@ class Gitea(Widget):
     if url is None or token is None or owner is None or repository is None:
       raise WidgetInitException("Required parameters: token, owner, repository")
 
-  def fetch_data(self):
-    """Fetch the repository information."""
-
-    url = self.params["url"]
-    token = self.params["token"]
-    owner = self.params["owner"]
-    repository = self.params["repository"]
-
-    headers = self.make_fetch_headers(**{
-      "Authorization": f"token {token}",
+  def make_fetch_headers(self, **kwargs):
+    """The API requests are authenticated with the token."""
+    return super().make_fetch_headers(**{
+      "Authorization": f"token {self.params['token']}",
+      **kwargs,
     })
 
-    url = f"{url}{self.URI_BASE}/{owner}/{repository}"
-    response = self.web_fetch("GET", url, headers=headers)
-    if not response.ok:
-      raise WidgetFetchDataException(f"Failed to fetch the Gitea info for {owner}/{repository}")
-    data = response.json()
+  def get_api_url(self) -> str:
+    """The repositories of the Gitea instance (url)."""
+    return f"{self.params['url']}{self.URI_BASE}"
 
-    data = self.augment_date_fields(
-      data,
-      ("created_at", "updated_at", "archived_at")
-    )
+  def prepare_repository(self, data: dict) -> dict:
+    """Gitea does not have these fields (as GitHub does)."""
 
     data["visibility"] = "private" if data.get("private") is True else "public"
     data["allow_forking"] = data.pop("fork", None) is True
-
-    if self.params["showrelease"]:
-      # Fetch the releases
-      url = f"{url}/releases"
-      response_releases = self.web_fetch("GET", url, headers=headers)
-      if response_releases.ok:
-        # We'll only bother showing releases if we get a successful
-        # response.
-        releases = response_releases.json()
-
-        if isinstance(releases, list) and len(releases) > 0:
-          latest_release = releases[-1]
-
-          latest_release = self.augment_date_fields(
-            latest_release,
-            ("created_at", "published_at")
-          )
-
-          author_fields = ("login", "avatar_url")
-          data["latest_release"] = {
-            "author": {
-              k: v
-              for k, v in latest_release["author"].items()
-              if k in author_fields
-            },
-          }
-
-          release_fields = (
-            "name",
-            "tag_name",
-            "created_at",
-            "created_at_ts",
-            "published_at",
-            "published_at_ts",
-          )
-
-          data["latest_release"].update({
-            k: v
-            for k, v in latest_release.items()
-            if k in release_fields
-          })
-
-    template = loader_env.get_template(self.CONTENT_TEMPLATE)
-
-    context = {}
-    context.update(data)
-    context.update({
-      "params": self.params,
-    })
-
-    html = template.render(context)
-    data["html"] = html
-
-    return data
-
-  def augment_date_fields(self, data: dict, date_fields: list | tuple) -> dict:
-    """Created a *_ts: timestamp key-pair based on the date values."""
-
-    for fld in date_fields:
-      try:
-        ts = pendulum.parse(data.get(fld)).int_timestamp
-        data[fld + "_ts"] = ts
-      except Exception:
-        pass
-
     return data
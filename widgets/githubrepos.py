@@ -0,0 +1,223 @@
+"""Widget: GitHub Repositories"""
+
+import hashlib
+import math
+import pendulum
+import urllib.parse
+
+from core.ratelimit import RATE_LIMITS
+from templates import loader_env
+from .widget import FetchRequest, Widget, WidgetInitException
+
+
+__all__ = ["GitHubRepos"]
+
+
+#
+# GitHubRepos Widget
+#
+class GitHubRepos(Widget):
+  """Several GitHub repositories at a glance: their stars, issues, last
+  push and latest release, all of them in one GraphQL query."""
+
+  ARGUMENTS = Widget.MAKE_ARGUMENTS(
+    [
+      ("repositories",  list),
+      ("token",         str),
+      ("url",           str,   "https://api.github.com/graphql"),
+      ("showrelease",   bool,  True),
+    ],
+    cache="1h"
+  )
+
+  ARGUMENTS_CONFIG = [
+    ("repositories", [
+      ("owner/repository", str),
+    ]),
+  ]
+
+  SCRIPT = True
+  STYLES = True
+  POST_FETCH = True
+  REFRESH_INTERVAL = 10 * 60
+
+  CONTENT_TEMPLATE = "widgets/githubrepos_item.html"
+
+  # The number of repositories per query (GitHub limits the number of
+  # nodes, and the cost, of a query).
+  CHUNK_SIZE = 25
+
+  QUERY_FRAGMENT = """
+fragment Repository on Repository {
+  nameWithOwner
+  url
+  stargazerCount
+  forkCount
+  pushedAt
+  issues(states: OPEN) { totalCount }
+  latestRelease { name tagName publishedAt url }
+}"""
+
+  def init(self):
+    """Validate the parameters."""
+
+    if not self.params["name"]:
+      self.params["name"] = "GitHub"
+
+    if not self.params["token"]:
+      raise WidgetInitException("Required parameters: token (the GraphQL API requires one)")
+
+    repositories = self.params["repositories"]
+    if not repositories:
+      raise WidgetInitException("Required parameters: repositories")
+
+    for repository in repositories:
+      if not isinstance(repository, str) or len(repository.split("/")) != 2 or not all(repository.split("/")):
+        raise WidgetInitException(f"Invalid repository '{repository}' (expected: owner/repository)")
+
+  def get_refresh_interval(self) -> int:
+    """The GraphQL API has its own rate limit: the refreshes of the
+    widgets using it share what is left until the limit gets reset."""
+
+    cost = math.ceil(len(self.params["repositories"]) / self.CHUNK_SIZE)
+    return RATE_LIMITS.get_refresh_interval(self.rate_limit_key, self.widget_id or str(id(self)), self.REFRESH_INTERVAL, cost)
+
+  @property
+  def rate_limit_key(self) -> str:
+    """The GraphQL rate limit is not the one of the REST API (same
+    host)."""
+    return f"{urllib.parse.urlsplit(self.params['url']).hostname}/graphql"
+
+  def fetch_plan(self, responses: dict) -> list[FetchRequest]:
+    """The repositories that are not cached, CHUNK_SIZE per query."""
+
+    headers = self.make_fetch_headers(**{
+      "Authorization": f"bearer {self.params['token']}",
+    })
+
+    missing = [
+      repository
+      for repository in self.params["repositories"]
+      if self.cache_get(self._get_repository_cache_key(repository)) is None
+    ]
+
+    plan = []
+    for idx in range(0, len(missing), self.CHUNK_SIZE):
+      plan.append(FetchRequest(f"chunk-{idx // self.CHUNK_SIZE}",
+                               self.params["url"],
+                               method="POST",
+                               headers=headers,
+                               json=self._make_query(missing[idx:idx + self.CHUNK_SIZE]),
+                               timeout=10,
+                               rate_limit_key=self.rate_limit_key))
+    return plan
+
+  def parse(self, responses: dict) -> dict:
+    """Cache each repository found in the responses (and the error of
+    each one the API could not resolve), then render all of them (in the
+    configured order)."""
+
+    aliases = { self._get_alias(repository): repository for repository in self.params["repositories"] }
+    contexts = {}
+    errors = {}
+
+    for response in responses.values():
+      payload = response.json()
+      for error in payload.get("errors") or []:
+        path = error.get("path") or []
+        if path and path[0] in aliases:
+          repository = aliases[path[0]]
+          errors[repository] = error.get("message")
+          # Not queried again (in its own chunk) until it expires.
+          self.cache_set(self._get_repository_cache_key(repository), {
+            "name_with_owner": repository,
+            "error": errors[repository] or "Not found",
+          }, self.params["cache"])
+
+      for alias, data in (payload.get("data") or {}).items():
+        if alias in aliases and data:
+          repository = aliases[alias]
+          contexts[repository] = self._get_repository_context(data)
+          self.cache_set(self._get_repository_cache_key(repository), contexts[repository], self.params["cache"])
+
+    template = loader_env.get_template(self.CONTENT_TEMPLATE)
+    items_html = ""
+
+    for repository in self.params["repositories"]:
+      context = contexts.get(repository) or self.cache_get(self._get_repository_cache_key(repository))
+      if context is None:
+        context = {
+          "name_with_owner": repository,
+          "error": errors.get(repository) or "Not found",
+        }
+
+      items_html += template.render(dict(context, params=self.params))
+
+    return {
+      "html": items_html.strip(),
+    }
+
+  def _get_alias(self, repository: str) -> str:
+    """Returns the query alias for this repository (the same for the
+    same repository in every query)."""
+    return "r" + hashlib.md5(repository.lower().encode()).hexdigest()[:12]
+
+  def _get_repository_cache_key(self, repository: str) -> str:
+    """Returns the cache key of a repository. The repositories are cached
+    individually, so the widgets showing the same ones share them if
+    they use the same token (a private repository is only visible to
+    some)."""
+
+    token_hash = hashlib.sha256(self.params["token"].encode()).hexdigest()[:16]
+    return f"repository {self.params['url']} {token_hash} {repository.lower()}"
+
+  def _make_query(self, repositories: list[str]) -> dict:
+    """Returns the GraphQL query (and its variables) for these
+    repositories."""
+
+    variables = {}
+    declarations = []
+    fields = []
+
+    for idx, repository in enumerate(repositories):
+      owner, name = repository.split("/")
+      variables.update({ f"owner{idx}": owner, f"name{idx}": name })
+      declarations.append(f"$owner{idx}: String!, $name{idx}: String!")
+      fields.append(f"  {self._get_alias(repository)}: repository(owner: $owner{idx}, name: $name{idx}) {{ ...Repository }}")
+
+    query = f"query({', '.join(declarations)}) {{\n" + "\n".join(fields) + "\n}" + self.QUERY_FRAGMENT
+    return { "query": query, "variables": variables }
+
+  def _get_repository_context(self, data: dict) -> dict:
+    """Returns what we need of the repository data (from the query)."""
+
+    pushed_at = self._parse_date(data.get("pushedAt"))
+
+    latest_release = data.get("latestRelease")
+    if isinstance(latest_release, dict):
+      published_at = self._parse_date(latest_release.get("publishedAt"))
+      latest_release = {
+        "name": latest_release.get("name"),
+        "tag_name": latest_release.get("tagName"),
+        "url": latest_release.get("url"),
+        "published_at_ts": published_at.int_timestamp if published_at is not None else None,
+        "elapsed": self.elapsed_since(published_at),
+      }
+
+    return {
+      "name_with_owner": data.get("nameWithOwner"),
+      "url": data.get("url"),
+      "stars_count": data.get("stargazerCount"),
+      "forks_count": data.get("forkCount"),
+      "open_issues_count": (data.get("issues") or {}).get("totalCount"),
+      "pushed_at_ts": pushed_at.int_timestamp if pushed_at is not None else None,
+      "pushed_elapsed": self.elapsed_since(pushed_at),
+      "latest_release": latest_release,
+    }
+
+  def _parse_date(self, value: str | None) -> pendulum.DateTime | None:
+    """Parses an ISO 8601 date from the API."""
+    try:
+      return pendulum.parse(value)
+    except Exception:
+      return None
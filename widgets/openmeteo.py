@@ -1,12 +1,16 @@
 """Widget: OpenMeteo"""
 
-import openmeteo_requests
-import pandas as pd
+import functools
+import hashlib
+import numpy as np
 import pendulum
+import threading
 
-from retry_requests import retry
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
 
-from .widget import Widget, WidgetInitException
+from core.coalescer import Coalescer
+from core.serialization import dumps
+from .widget import Widget, WidgetFetchDataException, WidgetInitException
 
 
 __all__ = ["OpenMeteo"]
@@ -23,25 +27,43 @@ class OpenMeteo(Widget):
 
   ARGUMENTS = Widget.MAKE_ARGUMENTS(
     [
-      ("latitude",  float),
-      ("longitude", float),
-      ("timezone",  str),
-      ("units",     str,   CELCIUS),
-      ("days",      int,   3),
-      ("graph",     bool,  True),
-      ("animation", bool,  True),
-      ("min",       bool,  True),
-      ("max",       bool,  True),
+      ("latitude",    float),
+      ("longitude",   float),
+      ("timezone",    str),
+      ("units",       str,   CELCIUS),
+      ("days",        int,   3),
+      ("graph",       bool,  True),
+      ("animation",   bool,  True),
+      ("min",         bool,  True),
+      ("max",         bool,  True),
+      ("resolution",  (int, float), 0.01),
+      ("maxpoints",   int,   0),
     ]
   )
 
   SCRIPT = True
   STYLES = True
   POST_FETCH = True
+  REFRESH_INTERVAL = 2 * 60
   URL_FORECAST = "https://api.open-meteo.com/v1/forecast"
 
   REQUESTS_SESSION_CACHE_TIMEOUT = 3600  # No cache param, we force this to be 1 hour!
 
+  # The API returns one response per location (comma-separated
+  # latitudes and longitudes): the widgets fetching the same parameters
+  # within the window are fetched with one request (at most
+  # MAX_LOCATIONS each), and each location's response is cached.
+  MAX_LOCATIONS = 50
+  COALESCER = Coalescer(window=0.05, max_items=MAX_LOCATIONS)
+
+  # The hourly series can be downsampled to 'maxpoints' points (see
+  # _downsample_temperature() and _downsample_precipitation()).
+  MIN_MAXPOINTS = 24
+
+  # The location cache hits and misses (see get_stats()).
+  _location_stats = { "hits": 0, "misses": 0, "locations_fetched": 0 }
+  _location_stats_lock = threading.Lock()
+
   def init(self):
     """Validate that we have a sane parameters."""
 
@@ -65,10 +87,29 @@ class OpenMeteo(Widget):
     if units not in (self.CELCIUS, self.FAHRENHEIT):
       raise WidgetInitException(f"Invalid 'units': {units}")
 
-    # Setup the Open-Meteo API client with cache and retry on error
-    req = self.get_requests()
-    retry_session = retry(req, retries=5, backoff_factor=0.2)
-    self.openmeteo_client = openmeteo_requests.Client(session=retry_session)
+    resolution = self.params["resolution"]
+    if resolution is None or resolution < 0 or resolution > 1:
+      raise WidgetInitException(f"Invalid 'resolution' parameter. It must be between 0 and 1 (degrees).")
+    self.params["resolution"] = float(resolution)
+
+    maxpoints = self.params["maxpoints"]
+    if maxpoints is None or maxpoints < 0 or 0 < maxpoints < self.MIN_MAXPOINTS:
+      raise WidgetInitException(f"Invalid 'maxpoints' parameter. It must be 0 (all the points) or at least {self.MIN_MAXPOINTS}.")
+
+  @classmethod
+  def get_stats(cls) -> dict:
+    """The location cache: its hits and misses, and the requests that
+    the misses took (see COALESCER)."""
+
+    with cls._location_stats_lock:
+      stats = dict(cls._location_stats)
+
+    lookups = stats["hits"] + stats["misses"]
+    stats.update({
+      "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else None,
+      "requests": cls.COALESCER.stats["batches"],
+    })
+    return stats
 
   def get_render_context_extras(self) -> dict:
     """Extra information for the template to use."""
@@ -98,19 +139,113 @@ class OpenMeteo(Widget):
 
     return data
 
+  def _get_timestamps(self, variables) -> np.ndarray:
+    """Returns the timestamps (seconds) of the values of the hourly or
+    daily variables of the response."""
+    return np.arange(variables.Time(), variables.TimeEnd(), variables.Interval(), dtype=np.int64)
+
   def _jsdate(self, timestamp: int, tz: str) -> str:
     """Converts the timestamp to an iso8601 string that JavaScript can
     parse."""
-    dt = pendulum.from_timestamp(timestamp, tz=tz).to_iso8601_string()
+    dt = pendulum.from_timestamp(int(timestamp), tz=tz).to_iso8601_string()
     return dt[:16]
 
-  def _convert_df_datevalue_to_tsvalue(self, df: dict, date_field: str, value_field: str, tz: str):
-    ts_dps = [
-      (self._jsdate(date.timestamp(), tz), round(value, 1))
-      for (_, date), (_, value) in zip(df[date_field].items(), df[value_field].items())
-    ]
+  def _make_series(self, variables, values: np.ndarray, indexes: np.ndarray | None = None) -> dict:
+    """Returns a series in the columnar format sent to the JS: the
+    timestamp (seconds) of the first value, the interval (seconds)
+    between the values, and the values (rounded, None if missing). The
+    JS converts the timestamps to the dates (in the widget's timezone).
+    A downsampled series only has the values at these indexes (sent as
+    well)."""
+
+    values = np.round(values.astype(np.float64), 1)
+    if indexes is not None:
+      values = values[indexes]
+
+    values_list = values.tolist()
+    if np.isnan(values).any():
+      values_list = [ None if np.isnan(value) else value for value in values_list ]
+
+    series = {
+      "start": int(variables.Time()),
+      "interval": int(variables.Interval()),
+      "values": values_list,
+    }
 
-    return ts_dps
+    if indexes is not None:
+      series["indexes"] = indexes.tolist()
+    return series
+
+  def _downsample_temperature(self, values: np.ndarray, maxpoints: int, points_per_day: int) -> np.ndarray | None:
+    """Returns the indexes of the temperatures to keep (at most
+    maxpoints), None to keep them all: the highs and lows of each day,
+    the rest picked by LTTB (see _lttb())."""
+
+    if not maxpoints or len(values) <= maxpoints:
+      return None
+
+    filled = np.nan_to_num(values.astype(np.float64))
+    days = [ filled[idx:idx + points_per_day] for idx in range(0, len(filled), points_per_day) ]
+    required = np.concatenate([
+      [ idx * points_per_day + np.argmax(day), idx * points_per_day + np.argmin(day) ]
+      for idx, day in enumerate(days)
+    ])
+    if len(required) > maxpoints - 3:
+      # Too many days for the points: the highest and lowest only.
+      required = np.array([ np.argmax(filled), np.argmin(filled) ])
+
+    return self._lttb(filled, maxpoints, required)
+
+  def _downsample_precipitation(self, values: np.ndarray, maxpoints: int) -> np.ndarray | None:
+    """Returns the indexes of the precipitations to keep (at most
+    maxpoints), None to keep them all. The chart draws steps, so the
+    values that change are all it needs; if there are too many of them,
+    the start of each precipitation event and the heaviest are kept, the
+    rest picked by LTTB (see _lttb())."""
+
+    if not maxpoints or len(values) <= maxpoints:
+      return None
+
+    filled = np.nan_to_num(values.astype(np.float64))
+    changes = np.flatnonzero(filled[1:] != filled[:-1]) + 1
+    indexes = np.unique(np.concatenate(([0], changes, [len(filled) - 1])))
+    if len(indexes) <= maxpoints:
+      return indexes
+
+    required = np.flatnonzero((filled[1:] > 0) & (filled[:-1] == 0)) + 1
+    required = np.append(required[:maxpoints // 2], np.argmax(filled))
+    return self._lttb(filled, maxpoints, required)
+
+  def _lttb(self, values: np.ndarray, maxpoints: int, required: np.ndarray) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: returns the (sorted) indexes of
+    at most maxpoints values that keep the shape of the series. The
+    first and last values are kept, then one value per bucket: the one
+    making the largest triangle with the value kept in the previous
+    bucket and the average of the next bucket. The required indexes are
+    kept as well (in place of as many buckets)."""
+
+    n = len(values)
+    required = np.unique(required)
+    n_buckets = max(maxpoints - len(required) - 2, 1)
+
+    x = np.arange(n, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+
+    selected = np.empty(n_buckets + 2, dtype=np.int64)
+    selected[0] = a = 0
+    for bucket in range(n_buckets):
+      lo, hi = edges[bucket], edges[bucket + 1]
+      if bucket + 1 < n_buckets:
+        next_lo, next_hi = edges[bucket + 1], edges[bucket + 2]
+        avg_x, avg_y = x[next_lo:next_hi].mean(), values[next_lo:next_hi].mean()
+      else:
+        avg_x, avg_y = x[n - 1], values[n - 1]
+
+      areas = np.abs((x[a] - avg_x) * (values[lo:hi] - values[a]) - (x[a] - x[lo:hi]) * (avg_y - values[a]))
+      selected[bucket + 1] = a = lo + np.argmax(areas)
+    selected[-1] = n - 1
+
+    return np.union1d(selected, required)
 
   def _get_current_tz(self) -> str:
     """Returns the host system's timezone."""
@@ -127,6 +262,10 @@ class OpenMeteo(Widget):
 
     weather_data = {}
 
+    # The forecast models have a grid of 1 to 11 km: the widgets in the
+    # same cell (of 'resolution' degrees) share the location's forecast.
+    latitude, longitude = self._snap_location(latitude, longitude)
+
     params = {
       "latitude": latitude,
       "longitude": longitude,
@@ -144,30 +283,115 @@ class OpenMeteo(Widget):
     if units == self.FAHRENHEIT:
       params["temperature_unit"] = units
 
-    responses = self.openmeteo_client.weather_api(self.URL_FORECAST, params=params)
+    response = self._fetch_location(params)
 
-    if len(responses):
-      response = responses[0]
+    weather_data.update({
+      "units": units_str,
+      "timezone": tz,
+      "current": self._get_current_data(response),
+    })
+
+    day_names = [
+      pendulum.now(tz=tz).start_of("day").add(days=i).format("ddd")
+      for i in range(params["forecast_days"])
+    ]
 
+    if self.params.graph:
       weather_data.update({
-        "units": units_str,
-        "current": self._get_current_data(response),
+        "hourly": self._get_hourly_data(response, tz),
+        "daily": self._get_daily_data(response, tz),
+        "day_names": day_names,
       })
 
-      day_names = [
-        pendulum.now(tz=tz).start_of("day").add(days=i).format("ddd")
-        for i in range(params["forecast_days"])
-      ]
-
-      if self.params.graph:
-        weather_data.update({
-          "hourly": self._get_hourly_data(response, tz),
-          "daily": self._get_daily_data(response, tz),
-          "day_names": day_names,
-        })
-
-      return weather_data
-    return None
+    return weather_data
+
+  def _fetch_location(self, params: dict) -> WeatherApiResponse:
+    """Returns the API response for the location (latitude, longitude)
+    of the params: cached, or fetched along with the other locations
+    requested with the same params (see COALESCER)."""
+
+    location = (params["latitude"], params["longitude"])
+    location_params = { k: v for k, v in params.items() if k not in ("latitude", "longitude") }
+    group = dumps(location_params, sort_keys=True)
+
+    message = self.cache_get(self._get_location_cache_key(group, location))
+    self._count_location_stat("hits" if message is not None else "misses")
+    if message is None:
+      message = self.COALESCER.submit(group, location, functools.partial(self._fetch_locations, group, location_params))
+
+    return WeatherApiResponse.GetRootAs(message, 0)
+
+  def _fetch_locations(self, group: str, params: dict, locations: list[tuple]) -> list[bytes]:
+    """Fetches the forecasts of these locations (with the same params)
+    in one request, caches them and returns them (the flatbuffers
+    message of each location)."""
+
+    unique_locations = list(dict.fromkeys(locations))
+
+    response = self.web_fetch("GET",
+                              self.URL_FORECAST,
+                              allowed_status_codes=[200, 400, 429],
+                              params={
+                                **params,
+                                "latitude": ",".join(str(latitude) for latitude, _ in unique_locations),
+                                "longitude": ",".join(str(longitude) for _, longitude in unique_locations),
+                                "format": "flatbuffers",
+                              })
+
+    if response.status_code != 200:
+      try:
+        reason = response.json().get("reason")
+      except Exception:
+        reason = None
+      raise WidgetFetchDataException(reason or f"Got status {response.status_code} for {self.URL_FORECAST}.")
+
+    messages = self._split_messages(response.content)
+    if len(messages) != len(unique_locations):
+      raise WidgetFetchDataException(f"Got {len(messages)} forecasts for {len(unique_locations)} locations.")
+
+    self._count_location_stat("locations_fetched", len(unique_locations))
+
+    duration_code = f"{self.get_cache_duration()}s"
+    for location, message in zip(unique_locations, messages):
+      self.cache_set(self._get_location_cache_key(group, location), message, duration_code)
+
+    messages = dict(zip(unique_locations, messages))
+    return [ messages[location] for location in locations ]
+
+  def _split_messages(self, content: bytes) -> list[bytes]:
+    """Splits the response content into the flatbuffers messages (one
+    per location), each of them prefixed by its length."""
+
+    messages = []
+    pos = 0
+    while pos < len(content):
+      if content[pos:pos + 4] == b"Unex":
+        # An error message ("Unexpected ...") in the stream.
+        raise WidgetFetchDataException(content[pos:].decode("utf-8", errors="replace"))
+      length = int.from_bytes(content[pos:pos + 4], byteorder="little")
+      messages.append(content[pos + 4:pos + 4 + length])
+      pos += 4 + length
+    return messages
+
+  def _snap_location(self, latitude: float, longitude: float) -> tuple[float, float]:
+    """Returns the location snapped to the nearest point of a grid of
+    'resolution' degrees (the location itself if the resolution is 0)."""
+
+    resolution = self.params["resolution"]
+    if not resolution:
+      return latitude, longitude
+    return (round(round(latitude / resolution) * resolution, 6),
+            round(round(longitude / resolution) * resolution, 6))
+
+  def _count_location_stat(self, stat: str, count: int = 1) -> None:
+    """Adds to a location cache statistic (see get_stats())."""
+    with self._location_stats_lock:
+      self._location_stats[stat] += count
+
+  def _get_location_cache_key(self, group: str, location: tuple) -> str:
+    """Returns the cache key of a location's response (for the params
+    of the group)."""
+    return f"location {hashlib.md5(group.encode()).hexdigest()} {location[0]},{location[1]}"
 
   def _get_current_data(self, weather_response) -> dict:
     """Returns the meta data (dict) for the current weather."""
@@ -193,46 +417,49 @@ class OpenMeteo(Widget):
     """Parse the hourly data from the response."""
 
     hourly = weather_response.Hourly()
-    hourly_temperature = hourly.Variables(0).ValuesAsNumpy()
-    hourly_precipitation = hourly.Variables(1).ValuesAsNumpy()
-
-    hourly_data = {
-      "date": pd.date_range(
-        start=pd.to_datetime(hourly.Time(), unit = "s", utc = True),
-        end=pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
-        freq=pd.Timedelta(seconds = hourly.Interval()),
-        inclusive = "left"
-      )
-    }
-
-    hourly_data["temperature"] = hourly_temperature
-    hourly_data["precipitation"] = hourly_precipitation
-    hourly_dataframe = pd.DataFrame(data=hourly_data)
+    timestamps = self._get_timestamps(hourly)
 
     # Remove last day, so that it matches with the daily data (this is
     # why we request an extra day to begin with).
-    end_date = pendulum.from_timestamp(hourly.TimeEnd(), tz=tz).subtract(days=1)
-    hourly_dataframe = hourly_dataframe[hourly_dataframe["date"] < end_date]
-
-    dps_temperature = self._convert_df_datevalue_to_tsvalue(hourly_dataframe, "date", "temperature", tz=tz)
-    dps_precipitation = self._convert_df_datevalue_to_tsvalue(hourly_dataframe, "date", "precipitation", tz=tz)
-
-    now = pendulum.now(tz=tz)
+    end_ts = pendulum.from_timestamp(hourly.TimeEnd(), tz=tz).subtract(days=1).int_timestamp
+    n = np.searchsorted(timestamps, end_ts, side="left")
+    timestamps = timestamps[:n]
+
+    hourly_temperature = hourly.Variables(0).ValuesAsNumpy()[:n]
+    hourly_precipitation = np.round(hourly.Variables(1).ValuesAsNumpy()[:n].astype(np.float64), 1)
+
+    # Fewer points for the chart (see 'maxpoints').
+    maxpoints = self.params["maxpoints"]
+    points_per_day = 86400 // hourly.Interval()
+    series_temperature = self._make_series(hourly,
+                                           hourly_temperature,
+                                           self._downsample_temperature(hourly_temperature, maxpoints, points_per_day))
+    series_precipitation = self._make_series(hourly,
+                                             hourly_precipitation,
+                                             self._downsample_precipitation(hourly_precipitation, maxpoints))
+
+    # The precipitation of the last hour (the first one), and the next
+    # one to come.
+    now = pendulum.now(tz=tz).timestamp()
     precip_cur = None
     precip_next = None
 
-    for dt, value in dps_precipitation:
-      precip_dt = pendulum.parse(dt, tz=tz)
-      if value:
-        minutes_since_precip = (now - precip_dt).total_minutes()
-        if precip_cur is None and now > precip_dt and minutes_since_precip < 60:
-          precip_cur = (self._jsdate(precip_dt.int_timestamp, tz=tz), value, minutes_since_precip)
-        if precip_next is None and precip_dt > now:
-          precip_next = (self._jsdate(precip_dt.int_timestamp, tz=tz), value, (precip_dt - now).total_minutes())
+    lo = np.searchsorted(timestamps, now - 3600, side="right")
+    hi = np.searchsorted(timestamps, now, side="left")
+    found = np.flatnonzero(hourly_precipitation[lo:hi])
+    if len(found):
+      idx = lo + found[0]
+      precip_cur = (self._jsdate(timestamps[idx], tz), float(hourly_precipitation[idx]), (now - timestamps[idx]) / 60)
+
+    lo = np.searchsorted(timestamps, now, side="right")
+    found = np.flatnonzero(hourly_precipitation[lo:])
+    if len(found):
+      idx = lo + found[0]
+      precip_next = (self._jsdate(timestamps[idx], tz), float(hourly_precipitation[idx]), (timestamps[idx] - now) / 60)
 
     data = {
-      "temperature": dps_temperature,
-      "precipitation": dps_precipitation,
+      "temperature": series_temperature,
+      "precipitation": series_precipitation,
       "precipitation_current": precip_cur,
       "precipitation_upcoming": precip_next,
     }
@@ -247,29 +474,10 @@ class OpenMeteo(Widget):
     daily_temperature_min = daily.Variables(1).ValuesAsNumpy()
     daily_precipitation_sum = daily.Variables(2).ValuesAsNumpy()
 
-    daily_data = {
-      "date": pd.date_range(
-        start=pd.to_datetime(daily.Time(), unit = "s", utc = True),
-        end=pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-        freq=pd.Timedelta(seconds = daily.Interval()),
-        inclusive="left"
-      )
-    }
-
-    daily_data["temperature_max"] = daily_temperature_max
-    daily_data["temperature_min"] = daily_temperature_min
-    daily_data["precipitation_sum"] = daily_precipitation_sum
-
-    daily_dataframe = pd.DataFrame(data=daily_data)
-
-    dps_temperature_min = self._convert_df_datevalue_to_tsvalue(daily_dataframe, "date", "temperature_min", tz=tz)
-    dps_temperature_max = self._convert_df_datevalue_to_tsvalue(daily_dataframe, "date", "temperature_max", tz=tz)
-    dps_precipitation = self._convert_df_datevalue_to_tsvalue(daily_dataframe, "date", "precipitation_sum", tz=tz)
-
     data = {
-      "temperature_min": dps_temperature_min,
-      "temperature_max": dps_temperature_max,
-      "precipitation": dps_precipitation,
+      "temperature_min": self._make_series(daily, daily_temperature_min),
+      "temperature_max": self._make_series(daily, daily_temperature_max),
+      "precipitation": self._make_series(daily, daily_precipitation_sum),
     }
 
     return data
@@ -0,0 +1,167 @@
+"""Base class of the repository widgets (GitHub, Gitea)."""
+
+import pendulum
+import urllib.parse
+
+from core.ratelimit import RATE_LIMITS
+from templates import loader_env
+from .widget import FetchRequest, Widget
+
+
+__all__ = ["RepositoryWidget"]
+
+
+#
+# RepositoryWidget
+#
+class RepositoryWidget(Widget):
+  """Repository information: the repository and its latest release,
+  fetched at the same time. The widgets supply the URL of the
+  repositories in their API (API_URL or get_api_url()) and prepare the
+  repository data for the template (prepare_repository())."""
+
+  SCRIPT = True
+  POST_FETCH = True
+
+  # The data is refreshed (pushed to the pages) this often at most, less
+  # often when the API's rate limit requires it (see
+  # get_refresh_interval()).
+  REFRESH_INTERVAL = 10 * 60
+
+  # The repositories in the API: a repository is found at
+  # {API_URL}/{owner}/{repository} (see get_repository_url()).
+  API_URL = ""
+
+  # The latest release, relative to the repository URL.
+  RELEASE_PATH = "/releases/latest"
+
+  # Renders the content of the widget (with the repository data).
+  CONTENT_TEMPLATE = ""
+
+  # A *_ts (timestamp) field is added for each of these date fields.
+  REPOSITORY_DATE_FIELDS = ("created_at", "updated_at")
+  RELEASE_DATE_FIELDS = ("created_at", "published_at")
+
+  # The release fields that are kept.
+  RELEASE_FIELDS = (
+    "name",
+    "tag_name",
+    "created_at",
+    "created_at_ts",
+    "published_at",
+    "published_at_ts",
+  )
+  RELEASE_AUTHOR_FIELDS = ("login", "avatar_url")
+
+  # The repository fields sent to the JS (the others are only used to
+  # render the content).
+  DATA_FIELDS = (
+    "html_url",
+    "language",
+    "name",
+    "updated_at_ts",
+    "visibility",
+  )
+
+  def get_api_url(self) -> str:
+    """Returns the URL of the repositories in the API. Widgets should
+    override this if it depends on the parameters."""
+    return self.API_URL
+
+  def get_repository_url(self) -> str:
+    """Returns the API URL of the repository."""
+    return f"{self.get_api_url()}/{self.params['owner']}/{self.params['repository']}"
+
+  def prepare_repository(self, data: dict) -> dict:
+    """Widgets should override this to adjust the repository data (from
+    the API) before it gets rendered."""
+    return data
+
+  def get_refresh_interval(self) -> int:
+    """The API may limit the number of requests (eg. GitHub allows 60
+    unauthenticated requests per hour): the refreshes of the widgets
+    using it share what is left until the limit gets reset."""
+
+    host = urllib.parse.urlsplit(self.get_repository_url()).hostname
+    cost = 2 if self.params["showrelease"] else 1
+    return RATE_LIMITS.get_refresh_interval(host, self.widget_id or str(id(self)), self.REFRESH_INTERVAL, cost)
+
+  def fetch_plan(self, responses: dict) -> list[FetchRequest]:
+    """The repository information and its latest release."""
+
+    headers = self.make_fetch_headers()
+    url = self.get_repository_url()
+
+    plan = [ FetchRequest("repository", url, headers=headers) ]
+    if self.params["showrelease"]:
+      # There is no release if this fails (404).
+      plan.append(FetchRequest("release", f"{url}{self.RELEASE_PATH}", headers=headers, optional=True))
+    return plan
+
+  def parse(self, responses: dict) -> dict:
+    """Build the repository information."""
+
+    data = responses["repository"].json()
+    data = self.augment_date_fields(data, self.REPOSITORY_DATE_FIELDS)
+    data = self.prepare_repository(data)
+
+    # We'll only bother showing releases if we get a successful
+    # response.
+    response_release = responses.get("release")
+    if response_release is not None and not isinstance(response_release, Exception):
+      latest_release = self.parse_release(response_release.json())
+      if latest_release is not None:
+        data["latest_release"] = latest_release
+
+    template = loader_env.get_template(self.CONTENT_TEMPLATE)
+
+    context = {}
+    context.update(data)
+    context.update({
+      "params": self.params,
+    })
+
+    results = { k: v for k, v in data.items() if k in self.DATA_FIELDS }
+    results.update({
+      "html": template.render(context),
+      "latest_release": data.get("latest_release"),
+      "owner": { "avatar_url": (data.get("owner") or {}).get("avatar_url") },
+    })
+
+    return results
+
+  def parse_release(self, release: dict) -> dict | None:
+    """Returns the release fields that we need."""
+
+    if not isinstance(release, dict):
+      return None
+
+    release = self.augment_date_fields(release, self.RELEASE_DATE_FIELDS)
+
+    latest_release = {
+      "author": {
+        k: v
+        for k, v in (release.get("author") or {}).items()
+        if k in self.RELEASE_AUTHOR_FIELDS
+      },
+    }
+
+    latest_release.update({
+      k: v
+      for k, v in release.items()
+      if k in self.RELEASE_FIELDS
+    })
+
+    return latest_release
+
+  def augment_date_fields(self, data: dict, date_fields: list | tuple) -> dict:
+    """Created a *_ts: timestamp key-pair based on the date values."""
+
+    for fld in date_fields:
+      try:
+        ts = pendulum.parse(data.get(fld)).int_timestamp
+        data[fld + "_ts"] = ts
+      except Exception:
+        pass
+
+    return data
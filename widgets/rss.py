@@ -5,7 +5,7 @@ import feedparser
 import pendulum
 
 from templates import loader_env
-from .widget import Widget, WidgetFetchDataException, WidgetInitException
+from .widget import FetchRequest, Widget, WidgetInitException
 
 
 __all__ = ["RSS"]
@@ -48,12 +48,29 @@ class RSS(Widget):
     if limit is not None and limit <= 0:
       raise WidgetInitException(f"Invalid argument: limit={limit} (must be greater than 0).")
 
-  def fetch_data(self):
-    """Fetch and parse the RSS feed."""
+  def fetch_plan(self, responses: dict) -> list[FetchRequest]:
+    """The feeds (all of them at the same time), by url."""
 
+    headers = self.make_fetch_headers(**{
+      "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+      "Accept-Encoding": "gzip, deflate",
+      "Connection": "keep-alive",
+      "Upgrade-Insecure-Requests": "1",
+      "Sec-Fetch-Dest": "document",
+      "Sec-Fetch-Mode": "navigate",
+      "Sec-Fetch-Site": "none",
+      "Sec-Fetch-User": "?1",
+    })
+
+    return [
+      FetchRequest(url, url, headers=headers, timeout=2, optional=True)
+      for url in self._get_urls()
+    ]
+
+  def _get_urls(self) -> list[str]:
+    """Returns the feed urls."""
     url = self.params["url"]
-    results = self._fetch_data(url)
-    return results
+    return [url] if isinstance(url, str) else url
 
   def _get_feed_entries_contexts(self, feed: feedparser.util.FeedParserDict, limit: int, urls: list) -> list[dict]:
     """Parse the feed entries and return HTML."""
@@ -149,13 +166,10 @@ class RSS(Widget):
 
     return sorted(contexts, key=lambda c: c["pub_ts"], reverse=True)
 
-  def _fetch_data(self, url: str | list):
-    """Fetch and parse the page, returning the final results."""
-
-    if isinstance(url, str):
-      url = [url]
+  def parse(self, responses: dict) -> dict:
+    """Parse the feeds (url: response), returning the final results."""
 
-    urls = url
+    urls = self._get_urls()
     contexts = []
     url_errors = {}
     titles = set()
@@ -163,25 +177,11 @@ class RSS(Widget):
     show = self.params["show"]
     limit = self.params["limit"]
 
-    headers = self.make_fetch_headers(**{
-      "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-      "Accept-Encoding": "gzip, deflate",
-      "Connection": "keep-alive",
-      "Upgrade-Insecure-Requests": "1",
-      "Sec-Fetch-Dest": "document",
-      "Sec-Fetch-Mode": "navigate",
-      "Sec-Fetch-Site": "none",
-      "Sec-Fetch-User": "?1",
-    })
-
     for url in urls:
-      # Fetch the raw feed data
-      try:
-        response = self.web_fetch("GET", url, headers=headers, timeout=2)
-        if not response.ok:
-          raise WidgetFetchDataException(f"Failed to fetch the feed: {url}")
-      except Exception as e:
-        url_errors[url] = e
+      # The raw feed data
+      response = responses.get(url)
+      if isinstance(response, Exception):
+        url_errors[url] = response
         continue
 
       # Parse the feed
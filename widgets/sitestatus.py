@@ -31,6 +31,7 @@ class SiteStatus(Widget):
   SCRIPT = True
   STYLES = True
   POST_FETCH = True
+  REFRESH_INTERVAL = 1 * 60
 
   STATUS_OK = 200
 
@@ -45,7 +46,9 @@ class SiteStatus(Widget):
       raise WidgetInitException(f"The 'urls' parameter is required.")
 
     # Run though each URL definition and make sure all is fine, set
-    # defaults along the way!
+    # defaults along the way! The entries come from the (read-only)
+    # config, so we work on copies.
+    url_entries = []
     for idx, url_entry in enumerate(urls, 1):
       assert isinstance(url_entry, dict)
       assert "url" in url_entry
@@ -53,15 +56,18 @@ class SiteStatus(Widget):
       status_accept = url_entry.get("status_accept")
       if not isinstance(status_accept, list):
         status_accept = []
-
-      # Write this back (it may not have been in the settings but we
-      # want the value to be ready when needed).
-      url_entry["status_accept"] = status_accept
+      status_accept = list(status_accept)
 
       # Make sure STATUS_OK is included in the status_accept list.
       if self.STATUS_OK not in status_accept:
         status_accept.append(self.STATUS_OK)
 
+      # Write this back (it may not have been in the settings but we
+      # want the value to be ready when needed).
+      url_entries.append(dict(url_entry, status_accept=status_accept))
+
+    self.params["urls"] = url_entries
+
   def fetch_data(self):
     """Obtain the site status for each URL in the params."""
 
@@ -34,6 +34,7 @@ class Tabs(Widget):
     context = super(Tabs, self).get_render_context()
     context.update({
       "tab_group_id": f"g-{self.uniqueclass}",
+      "page_widgets": self.page_widgets,
     })
 
     return context
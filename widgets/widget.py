@@ -1,17 +1,23 @@
 """Base Widget Class"""
 
-import json
+import inspect
 import logging
 import pendulum
 import requests
 import requests_cache
 import retry_requests
+import urllib.parse
 
 from core.cache import CACHE, InvalidCacheDuration
+from core.compression import CompressedContent
+from core.fetch import FETCH_ENGINE
+from core.ratelimit import RATE_LIMITS
+from core.serialization import dumps, dumps_bytes
 from templates import loader_env
 
 
 __all__ = [
+  "FetchRequest",
   "Widget",
   "WidgetArgumentException",
   "WidgetArgumentValueException",
@@ -74,15 +80,8 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 
 #
-# Widget Parameters Class and JSON Encoder
+# Widget Parameters Class
 #
-class ParamsJSONEncoder(json.JSONEncoder):
-  def default(self, o: any):
-    if isinstance(o, Widget):
-      return str(o)
-    return super(ParamsJSONEncoder, self).default(o)
-
-
 class Params:
   """Simple setter/getter backed by a dictionary."""
 
@@ -109,7 +108,7 @@ class Params:
   @property
   def json(self) -> str:
     """Returns the JSON representation of our params data."""
-    return json.dumps(self.__dict__, cls=ParamsJSONEncoder)
+    return dumps(self.__dict__)
 
   @property
   def configArgs(self) -> str:
@@ -117,11 +116,46 @@ class Params:
     This method has a blacklist of widget types it must ignore."""
 
     blacklist = ("tabs",)
-    return json.dumps({
+    return dumps({
       k: v
       for k, v in self.__dict__.items()
       if k not in blacklist
-    } or None, cls=ParamsJSONEncoder)
+    } or None)
+
+
+#
+# Fetch Request Class
+#
+class FetchRequest:
+  """A request declared in a widget's fetch_plan(). Its response is
+  passed to parse() under 'name'. The other arguments are the same as
+  for web_fetch(). If the widget can do without the response, set
+  'optional': parse() then gets the exception when the request fails
+  (the widget fails with the request otherwise)."""
+
+  def __init__(self,
+               name: str,
+               url: str,
+               method: str = "GET",
+               allowed_status_codes: int | list = 200,
+               optional: bool = False,
+               **kwargs) -> None:
+    self.name = name
+    self.url = url
+    self.method = method.upper()
+    self.allowed_status_codes = allowed_status_codes
+    self.optional = optional
+    self.kwargs = kwargs
+
+  def __repr__(self) -> str:
+    return f"FetchRequest-{self.name} {self.method} {self.url}"
+
+  @property
+  def key(self) -> str:
+    """Returns the key of the request: identical requests (from any
+    widget) have the same key. See Widget.get_fetch_request_key() for
+    the key they are deduplicated with."""
+    return dumps([self.method, self.url, self.allowed_status_codes, self.kwargs], sort_keys=True)
 
 
 #
@@ -203,6 +237,20 @@ class Widget(WidgetBase):
   # data should set this to True and implement the 'fetch_data()' method.
   POST_FETCH = False
 
+  # Set to a number of seconds to have the data of the widget refreshed
+  # (by the server) and pushed to the pages showing it when it changes.
+  REFRESH_INTERVAL = None
+
+  # Set by the WidgetFinder: all the widgets found on the same page (see
+  # widgets.PageWidgets). Container widgets (eg. Tabs) use it to render
+  # the widgets they hold.
+  page_widgets = None
+
+  # Set by the WidgetFinder: the stable id of this widget (the same in
+  # every worker for a given config). The JS uses it to request the
+  # widget's data.
+  widget_id = None
+
   # Requests and Caching
   HAS_REQUESTS_SESSION = True
   REQUESTS_SESSION_CACHE_TIMEOUT = 3600  # Default timeout (gets ignored if widget has a 'cache' param)
@@ -269,6 +317,11 @@ class Widget(WidgetBase):
     """Returns a string representation of our Widget."""
     return f"Widget-{self.classname}"
 
+  def __json__(self) -> str:
+    """Returns the JSON representation of our Widget (see
+    core.serialization)."""
+    return str(self)
+
   #
   # Properties
   #
@@ -303,9 +356,28 @@ class Widget(WidgetBase):
 
   @property
   def uniqueclass(self) -> str:
-    """Returns a unique ID for the current Widget (this ID unique per
-    execution and not bound to an individual Widget)."""
-    return f"wid-{id(self)}"
+    """Returns a unique ID for the current Widget. This is based on the
+    widget id when the Widget was found in the config, otherwise it is
+    unique per execution only."""
+    return f"wid-{self.widget_id or id(self)}"
+
+  @property
+  def is_async(self) -> bool:
+    """Returns True if the widget's fetch_data() is a coroutine function
+    (async def fetch_data(), see core.fetch)."""
+    return inspect.iscoroutinefunction(self.fetch_data)
+
+  def get_refresh_interval(self) -> int | None:
+    """Returns the number of seconds between the refreshes of the
+    widget's data (see REFRESH_INTERVAL). Widgets may override this to
+    adjust it (eg. to an API's rate limit)."""
+    return self.REFRESH_INTERVAL
+
+  @property
+  def has_fetch_plan(self) -> bool:
+    """Returns True if the widget declares its requests (fetch_plan())
+    instead of implementing fetch_data()."""
+    return type(self).fetch_plan is not Widget.fetch_plan
 
   @property
   def html(self) -> str:
@@ -361,17 +433,30 @@ class Widget(WidgetBase):
     """Initialize the cache for this widget type."""
     CACHE.init_cache(self.cache_widget_type)
 
-  def _init_args(self) -> None:
-    """Initialize the arguments configured in self.ARGUMENTS. This will
-    validate and make the property available to the "param" property."""
+  @classmethod
+  def _get_argument_plan(cls) -> tuple[tuple, ...]:
+    """Returns the compiled ARGUMENTS for this class: a tuple of (name,
+    validator, is_type, default_value). The declarations are checked
+    (and deduplicated) on first use only, then kept on the class."""
+
+    plan = cls.__dict__.get("_argument_plan")
+    if plan is None:
+      plan = cls._compile_arguments()
+      cls._argument_plan = plan
+    return plan
+
+  @classmethod
+  def _compile_arguments(cls) -> tuple[tuple, ...]:
+    """Validates the ARGUMENTS declarations and returns the argument
+    plan (see _get_argument_plan)."""
 
     type_set = (list, tuple, set)
 
     # Remove duplicate arg declarations (if any).
-    d_arg_decl = { widget_args[0]: widget_args for widget_args in self.ARGUMENTS }
-    all_arguments = list(d_arg_decl.values())
+    d_arg_decl = { widget_args[0]: widget_args for widget_args in cls.ARGUMENTS }
 
-    for widget_args in all_arguments:
+    plan = []
+    for widget_args in d_arg_decl.values():
       try:
         # We need 2 entries minimum: name, type/validator.
         # The third option, default value, is optional and will default
@@ -384,26 +469,31 @@ class Widget(WidgetBase):
       name, validator = widget_args[:2]
       default_value = widget_args[2] if len(widget_args) > 2 else None
 
-      # Validate the argument supplied.
+      # Validate the argument declaration.
       assert isinstance(name, str) and len(name) > 0
       assert isinstance(validator, type) \
           or isinstance(validator, type_set) \
           or callable(validator)
 
-      arg = self.kwargs.get(name)
-      if arg is None and default_value is not None:
-        arg = default_value
+      is_type = isinstance(validator, type) or isinstance(validator, type_set)
+      plan.append((name, validator, is_type, default_value))
+
+    return tuple(plan)
 
-      valid = False
-      valid = (
-        isinstance(arg, validator)
-        if isinstance(validator, type)
-        or isinstance(validator, type_set)
-        else validator(arg)
-      )
+  def _init_args(self) -> None:
+    """Initialize the arguments configured in self.ARGUMENTS. This will
+    validate and make the property available to the "param" property."""
+
+    kwargs = self.kwargs
+    params = self.params
+
+    for name, validator, is_type, default_value in self._get_argument_plan():
+      arg = kwargs.get(name)
+      if arg is None:
+        arg = default_value
 
-      if valid:
-        self.params[name] = arg
+      if isinstance(arg, validator) if is_type else validator(arg):
+        params[name] = arg
       elif arg is not None:
         raise WidgetArgumentValueException(
           f"Parameter '{name}' ("
@@ -432,6 +522,21 @@ class Widget(WidgetBase):
 
     return None
 
+  def get_cache_duration(self, cache_duration: int | str | None = None) -> int:
+    """Returns the cache duration (in seconds) of the web requests: the
+    one specified (the amount of seconds or the cache code), the widget's
+    'cache' param or the default (REQUESTS_SESSION_CACHE_TIMEOUT)."""
+
+    cache_duration = cache_duration or self.params[self.PARAM_CACHE]
+    if isinstance(cache_duration, str):
+      try:
+        cache_duration = CACHE.duration_to_ts(cache_duration, as_seconds=True)
+      except InvalidCacheDuration:
+        cache_duration = None
+    if not isinstance(cache_duration, int):
+      cache_duration = self.REQUESTS_SESSION_CACHE_TIMEOUT
+    return cache_duration
+
   def get_requests(self, cache_duration: int | str | None = None) -> requests_cache.CachedSession:
     """Returns the requests_cache's session or plain requests object
     based on the widget configuration. You may optionally specify the
@@ -441,16 +546,7 @@ class Widget(WidgetBase):
     session = None
 
     if self.HAS_REQUESTS_SESSION:
-      cache_duration = cache_duration or self.params[self.PARAM_CACHE]
-      if isinstance(cache_duration, str):
-        try:
-          cache_duration = CACHE.duration_to_ts(cache_duration, as_seconds=True)
-        except InvalidCacheDuration:
-          cache_duration = None
-      if not isinstance(cache_duration, int):
-        cache_duration = self.REQUESTS_SESSION_CACHE_TIMEOUT
-
-      session = CACHE.get_requests_session(self, cache_duration)
+      session = CACHE.get_requests_session(self, self.get_cache_duration(cache_duration))
     else:
       session = requests.Session()
 
@@ -495,6 +591,13 @@ class Widget(WidgetBase):
     cost of memory usage). Return None to not use internal caching."""
     return None
 
+  @classmethod
+  def get_stats(cls) -> dict | None:
+    """Widgets may return statistics about their fetches (eg. the hit
+    ratio of a cache), served by /widget/<type>/stats. They are kept by
+    each process (worker)."""
+    return None
+
   def cache_get(self, key: str) -> any:
     """Retrieves cache data. Returns None if there is no cached data or
     if it is expired."""
@@ -526,6 +629,13 @@ class Widget(WidgetBase):
     """Stores cache data."""
     return CACHE.set_cache(self.cache_widget_type, key, data, duration_code)
 
+  def serialize_data(self, data: dict) -> CompressedContent:
+    """Returns the data (from fetch_data()) serialized as the JSON
+    response, along with its ETag and compressed variants. This is what
+    gets cached, so it is only done when the data is fetched."""
+
+    return CompressedContent(dumps_bytes(data, sort_keys=True), "application/json")
+
   def log_debug(self, message: str):
     """Logs a message for DEBUG."""
     return self.logger.debug(self._build_log_message(message))
@@ -595,7 +705,46 @@ class Widget(WidgetBase):
   def fetch_data(self) -> dict:
     """Fetch the data for this widget (this would be initiated by the
     JS, post-load). This should get overwritten if the widget has post
-    fetching."""
+    fetching. It may be overwritten with an 'async def fetch_data()', it
+    then runs on the fetch engine (see core.fetch) and should use
+    web_fetch_async()."""
+
+    return {}
+
+  def fetch_plan(self, responses: dict) -> list[FetchRequest] | None:
+    """Widgets may declare the requests they need here (a list of
+    FetchRequest) instead of making them in fetch_data(). These are made
+    by the fetch engine at the same time as the requests of the other
+    widgets (identical requests are made once) and the responses are
+    passed to parse(). This is called again with the responses received
+    so far (name: response) until it returns no new request, so the
+    requests that depend on other responses are returned once these are
+    available. The requests whose name already has a response are
+    ignored. Return None (the default) on the first call (no responses)
+    to use fetch_data() instead, None or [] on the later ones once done."""
+
+    return None
+
+  def get_fetch_request_key(self, fetch_request: FetchRequest) -> str:
+    """Returns the key the fetch engine deduplicates the request with.
+    The request is made with the web_fetch_async() of one of the widgets
+    sharing it, so the key includes how this widget caches the response
+    (cache type and duration): only the widgets that cache it the same
+    way share it."""
+
+    kwargs = fetch_request.kwargs
+    cache_type = expire_after = None
+    if self.HAS_REQUESTS_SESSION:
+      cache_type = self.cache_widget_type
+      expire_after = kwargs.get("expire_after")
+      if expire_after is None:
+        expire_after = self.get_cache_duration(kwargs.get("cache_duration"))
+    return f"{cache_type} {expire_after} {fetch_request.key}"
+
+  def parse(self, responses: dict) -> dict:
+    """Builds the data of the widget (as fetch_data() would) from the
+    responses of the fetch_plan() requests (name: response). This runs in
+    the fetch engine's thread pool."""
 
     return {}
 
@@ -604,9 +753,12 @@ class Widget(WidgetBase):
     code is not in the allowed_status_codes list then we'll raise
     WidgetFetchDataException. Otherwise we will return the response. You
     can specify a customer cache_duration in the kwargs to set this
-    request's cache timeout (overriding the default behavior)."""
+    request's cache timeout (overriding the default behavior), and a
+    rate_limit_key if the API has several rate limits (the host's is
+    used otherwise, see core.ratelimit)."""
 
     cache_duration = kwargs.pop("cache_duration", None)
+    rate_limit_key = kwargs.pop("rate_limit_key", None)
 
     try:
       assert isinstance(method, str)
@@ -633,12 +785,30 @@ class Widget(WidgetBase):
       # This argument does not exist for the real requests object.
       kwargs.pop("expire_after", None)
 
+    rate_limit_key = rate_limit_key or urllib.parse.urlsplit(url).hostname
+    rate_limited = RATE_LIMITS.is_exhausted(rate_limit_key)
+    if rate_limited:
+      if not is_request_cache_session:
+        raise WidgetFetchDataException(f"The rate limit of {rate_limit_key} is exhausted.")
+      # Only use the cached response, even if it expired.
+      kwargs["only_if_cached"] = True
+      kwargs["headers"] = {
+        **(kwargs.get("headers") or {}),
+        "Cache-Control": f"stale-if-error={FETCH_ENGINE.STALE_DURATION}",
+      }
+
     self.log_debug(f"web_fetch {method.upper()} {url}")
     try:
       response = requests_method(url, **kwargs)
     except Exception as e:
       raise WidgetFetchDataException(str(e))
 
+    if not getattr(response, "from_cache", False):
+      RATE_LIMITS.update(rate_limit_key, response.headers)
+    elif rate_limited and response.status_code == 504:
+      # Nothing cached (requests_cache's only_if_cached response).
+      raise WidgetFetchDataException(f"The rate limit of {rate_limit_key} is exhausted.")
+
     if response.status_code not in allowed_status_codes:
       if is_request_cache_session:
         self.log_debug(f"Received Status Code {response.status_code}, deleting cache for {url}")
@@ -646,3 +816,50 @@ class Widget(WidgetBase):
       raise WidgetFetchDataException(f"Got status {response.status_code} for {url}.")
 
     return response
+
+  async def web_fetch_async(self, method: str, url, allowed_status_codes: int | list = 200, **kwargs):
+    """Same as web_fetch(), for the async widgets. The request is sent
+    with the fetch engine's shared client (httpx) and cached in memory
+    for the same duration as web_fetch() would, or by web_fetch() in the
+    engine's thread pool when httpx is not installed. Either way the
+    response has the status_code, headers, content, text and json()."""
+
+    if not FETCH_ENGINE.has_client:
+      return await FETCH_ENGINE.call(self.web_fetch, method, url, allowed_status_codes, **kwargs)
+
+    cache_duration = kwargs.pop("cache_duration", None)
+    expire_after = kwargs.pop("expire_after", None)
+    rate_limit_key = kwargs.pop("rate_limit_key", None)
+
+    try:
+      assert isinstance(method, str)
+
+      if isinstance(allowed_status_codes, int):
+        allowed_status_codes = [allowed_status_codes]
+
+      assert isinstance(allowed_status_codes, list)
+    except AssertionError as e:
+      raise WidgetWebFetchException(str(e)) from e
+
+    if self.HAS_REQUESTS_SESSION and expire_after is None:
+      expire_after = self.get_cache_duration(cache_duration)
+
+    # The requests argument names that differ for httpx.
+    if "allow_redirects" in kwargs:
+      kwargs["follow_redirects"] = kwargs.pop("allow_redirects")
+
+    self.log_debug(f"web_fetch_async {method.upper()} {url}")
+    try:
+      response = await FETCH_ENGINE.request(method,
+                                            url,
+                                            cache_type=self.cache_widget_type if self.HAS_REQUESTS_SESSION else None,
+                                            expire_after=expire_after,
+                                            rate_limit_key=rate_limit_key,
+                                            **kwargs)
+    except Exception as e:
+      raise WidgetFetchDataException(str(e))
+
+    if response.status_code not in allowed_status_codes:
+      raise WidgetFetchDataException(f"Got status {response.status_code} for {url}.")
+
+    return response
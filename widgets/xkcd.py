@@ -26,14 +26,15 @@ class xkcd(Widget):
 
   WIDGET_CLASS_NAME = "comic"
 
-  def fetch_data(self):
+  async def fetch_data(self):
     """The JS is requesting data (post-load). We need to prepare the
-    data and return JSON."""
+    data and return JSON. This runs on the fetch engine (async)."""
 
     headers = self.make_fetch_headers()
-    response = self.web_fetch("GET", self.URL, headers=headers)
-    if not response.ok:
-      raise WidgetFetchDataException(f"Retrieving the xkcd url failed.")
+    try:
+      response = await self.web_fetch_async("GET", self.URL, headers=headers)
+    except WidgetFetchDataException as e:
+      raise WidgetFetchDataException(f"Retrieving the xkcd url failed.") from e
 
     results = response.json()
     results["url"] = results.pop("img", None)